@@ -0,0 +1,49 @@
+"""Sorteio de linhas sem ``order_by('?')``.
+
+``order_by('?')`` ordena a tabela inteira a cada chamada. Aqui o sorteio é
+por faixa de ids: guarda em cache o menor e o maior pk do queryset, sorteia
+um valor nesse intervalo e pega a primeira linha com pk >= sorteado (uma
+busca pelo índice da chave primária). Se não houver nenhuma depois dele, dá a
+volta e pega a última antes. Buracos na sequência de ids deixam o sorteio um
+pouco enviesado para as linhas logo após os buracos, o que basta para
+vitrines como o perfil em destaque da home. Linhas criadas depois que os
+limites foram para o cache só entram no sorteio quando o TTL vence.
+"""
+import hashlib
+import random
+
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+AMOSTRAGEM_LIMITES_TTL = 10 * 60
+
+
+def _chave_limites(queryset):
+    sql = str(queryset.query).encode()
+    return f"amostragem:{queryset.model._meta.label_lower}:{hashlib.md5(sql).hexdigest()}"
+
+
+def limites_pk(queryset):
+    """(menor pk, maior pk) do queryset, em cache. None se estiver vazio."""
+    chave = _chave_limites(queryset)
+    limites = cache.get(chave)
+    if limites is None:
+        agg = queryset.aggregate(menor=Min('pk'), maior=Max('pk'))
+        limites = (agg['menor'], agg['maior']) if agg['menor'] is not None else ()
+        cache.set(chave, limites, AMOSTRAGEM_LIMITES_TTL)
+    return limites or None
+
+
+def sortear(queryset, excluir=()):
+    """Uma linha aleatória do queryset (pk inteiro), ou None."""
+    limites = limites_pk(queryset)
+    if not limites:
+        return None
+
+    candidatos = queryset.exclude(pk__in=excluir) if excluir else queryset
+    alvo = random.randint(*limites)
+    return (
+        candidatos.filter(pk__gte=alvo).order_by('pk').first()
+        or candidatos.filter(pk__lt=alvo).order_by('-pk').first()
+    )
+
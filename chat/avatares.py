@@ -0,0 +1,91 @@
+"""Fotos de perfil guardadas como arquivo, não como data URL no banco.
+
+O edit.html ainda manda a foto como data URL; ``salvar_avatar`` decodifica
+uma vez, identifica pelo sha256 da imagem e grava em ``MEDIA_ROOT/avatares/``
+as versões reduzidas em WebP. As linhas (Usuario.foto, Recado.foto,
+SolicitacaoClube.foto_url) guardam só a URL. A mesma imagem enviada de novo,
+por qualquer usuário, reaproveita os arquivos existentes.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .uploads import limite_upload
+
+AVATAR_DIR = 'avatares'
+# Lado maior, em pixels: foto do perfil e miniatura (recados, listas)
+AVATAR_PX = 256
+AVATAR_MINI_PX = 64
+
+DATA_URL_RE = re.compile(r'^data:(image/[\w.+-]+);base64,(.*)$', re.S)
+
+
+class AvatarError(Exception):
+    pass
+
+
+def eh_data_url(valor):
+    return bool(valor) and valor.startswith('data:')
+
+
+def caminho_avatar(digest, mini=False):
+    return f"{AVATAR_DIR}/{digest}{'_mini' if mini else ''}.webp"
+
+
+def salvar_avatar(valor):
+    """Troca um data URL pela URL do avatar gravado; outros valores passam direto."""
+    if not eh_data_url(valor):
+        return valor
+
+    casamento = DATA_URL_RE.match(valor)
+    if not casamento:
+        raise AvatarError("Foto inválida")
+    content_type, dados = casamento.groups()
+    if len(dados) * 3 // 4 > limite_upload(content_type):
+        raise AvatarError("Foto muito grande")
+    try:
+        bruto = base64.b64decode(dados)
+    except (binascii.Error, ValueError):
+        raise AvatarError("Foto inválida")
+
+    digest = hashlib.sha256(bruto).hexdigest()
+    principal = caminho_avatar(digest)
+    if not default_storage.exists(principal):
+        gravar_variantes(bruto, digest)
+    return default_storage.url(principal)
+
+
+def gravar_variantes(bruto, digest):
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        img = Image.open(io.BytesIO(bruto))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        # DecompressionBombError: arquivo pequeno que declara dimensões enormes
+        raise AvatarError("Foto inválida")
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+
+    # Da maior para a menor, reaproveitando a redução anterior
+    for px, mini in ((AVATAR_PX, False), (AVATAR_MINI_PX, True)):
+        img.thumbnail((px, px), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, 'WEBP', quality=85)
+        caminho = caminho_avatar(digest, mini)
+        if not default_storage.exists(caminho):
+            default_storage.save(caminho, ContentFile(buf.getvalue()))
+
+
+def url_mini(url):
+    """URL da miniatura de um avatar do store; outras URLs voltam iguais."""
+    prefixo = default_storage.url(f"{AVATAR_DIR}/")
+    if url and url.startswith(prefixo) and url.endswith('.webp') and not url.endswith('_mini.webp'):
+        return url[:-len('.webp')] + '_mini.webp'
+    return url
@@ -1,7 +1,14 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
 
+from .media import (
+    descartar_midia_sala, media_content_type, media_existe, media_url, nome_seguro,
+)
+from .matching import find_partner, get_matchmaker, match_group, parse_temp_interests
+from .realtime import conversa_group, sala_group
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
@@ -30,8 +37,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             room.delete()
         except ChatRoom.DoesNotExist:
             pass
+        # A mídia da sala só vive enquanto a sala existir
+        descartar_midia_sala(room_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # A mídia sobe por HTTP (chat_media_upload); frames binários são ignorados
+        if text_data is None:
+            return
 
-    async def receive(self, text_data):
         data = json.loads(text_data)
         msg_type = data.get("type")
 
@@ -52,17 +65,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
 
         elif msg_type == "media":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_media",
-                    "filename": data["filename"],
-                    "content_type": data["content_type"],
-                    "data": data["data"],
-                    "sender_id": self.scope["user"].id,
-                    "sender_name": self.scope["user"].username,
-                }
-            )
+            # Arquivo já enviado por HTTP: só o id passa pelo socket
+            media_id = data.get("media_id")
+            if await sync_to_async(media_existe, thread_sensitive=False)(self.room_id, media_id):
+                await self.broadcast_media(media_id, data.get("filename"))
+            else:
+                await self.send_media_error("Arquivo não encontrado")
 
         elif msg_type == "video-offer":
             await self.channel_layer.group_send(
@@ -94,6 +102,27 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             )
 
+    # Mídia já gravada na sala (ver chat/media.py)
+
+    async def broadcast_media(self, media_id, filename):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "chat_media",
+                "media_id": media_id,
+                "filename": nome_seguro(filename),
+                "content_type": media_content_type(media_id),
+                "url": media_url(self.room_id, media_id),
+                "sender": self.channel_name,
+            }
+        )
+
+    async def send_media_error(self, erro):
+        await self.send(json.dumps({
+            "type": "media-error",
+            "error": erro,
+        }))
+
     # Handlers para mensagens de chat e mídia
 
     async def chat_message(self, event):
@@ -106,12 +135,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def chat_media(self, event):
         await self.send(json.dumps({
             "type": "media",
+            "media_id": event["media_id"],
             "filename": event["filename"],
             "content_type": event["content_type"],
-            "data": event["data"],
-            "sender_id": event["sender_id"],
-            "sender_name": event["sender_name"],
-            "is_self": event["sender_id"] == self.scope["user"].id
+            "url": event["url"],
+            "sender": event["sender"] == self.channel_name
         }))
 
     async def user_typing(self, event):
@@ -146,3 +174,193 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 "type": "ice-candidate",
                 "candidate": event["candidate"]
             }))
+
+
+class MatchConsumer(AsyncWebsocketConsumer):
+    """Espera por parceiro do chat aleatório sem polling.
+
+    O cliente manda {"type": "register", ...} uma vez com os mesmos campos do
+    find_match e recebe {"type": "match", "room_id": ...} assim que for pareado,
+    seja por ele mesmo ou por quem entrar na fila depois.
+    """
+
+    async def connect(self):
+        self.session_key = self.scope["session"].session_key
+        self.matched = False
+        if not self.session_key:
+            await self.close()
+            return
+
+        self.group_name = match_group(self.session_key)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if not self.session_key:
+            return
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        # Fechou a página sem ser pareado: sai da fila
+        if not self.matched:
+            await sync_to_async(get_matchmaker().leave)(self.session_key)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Só o ChatConsumer recebe frames binários; aqui são ignorados
+        if text_data is None:
+            return
+
+        data = json.loads(text_data)
+        msg_type = data.get("type")
+
+        if msg_type == "register":
+            room_id = await self.register(data)
+            if room_id is False:
+                await self.send(json.dumps({"type": "error", "message": "Usuário não encontrado"}))
+            elif room_id:
+                await self.match_found({"room_id": room_id})
+
+        elif msg_type == "cancel":
+            await sync_to_async(get_matchmaker().leave)(self.session_key)
+
+    @database_sync_to_async
+    def register(self, data):
+        from .middleware import usuario_da_sessao
+
+        # Mesma busca do find_match (request.usuario)
+        usuario = usuario_da_sessao(self.scope["session"])
+        if not usuario:
+            return False
+
+        temp_interests = []
+        if data.get("use_temp_interests"):
+            temp_interests = parse_temp_interests(data.get("temp_interests_raw", ""))
+        return find_partner(self.session_key, usuario, temp_interests)
+
+    async def match_found(self, event):
+        if self.matched:
+            return
+        self.matched = True
+        await self.send(json.dumps({
+            "type": "match",
+            "room_id": event["room_id"]
+        }))
+
+
+class ConversationConsumer(AsyncWebsocketConsumer):
+    """Entrega em tempo real de uma Conversation (mensagem privada).
+
+    As mensagens continuam sendo enviadas por HTTP (send_conversation_message),
+    que publica no grupo; pelo socket trafegam só "typing" e confirmações de
+    leitura ({"type": "read", "ultimo_id": ...}).
+    """
+
+    async def connect(self):
+        self.conv_id = self.scope["url_route"]["kwargs"]["conv_id"]
+        self.usuario_id = await self.get_participante()
+        if not self.usuario_id:
+            await self.close()
+            return
+
+        self.group_name = conversa_group(self.conv_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.usuario_id:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @database_sync_to_async
+    def get_participante(self):
+        from django.db.models import Q
+        from .middleware import usuario_da_sessao
+        from .models import Conversation
+
+        usuario = usuario_da_sessao(self.scope["session"])
+        if not usuario:
+            return None
+        participa = Conversation.objects.filter(
+            Q(user1_id=usuario.id) | Q(user2_id=usuario.id), id=self.conv_id
+        ).exists()
+        return usuario.id if participa else None
+
+    @database_sync_to_async
+    def marcar_lida(self, ultimo_id):
+        from .models import ConversaParticipante
+
+        return ConversaParticipante.marcar_lida(self.conv_id, self.usuario_id, ultimo_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Só o ChatConsumer recebe frames binários; aqui são ignorados
+        if text_data is None:
+            return
+
+        data = json.loads(text_data)
+        msg_type = data.get("type")
+
+        if msg_type == "typing":
+            await self.channel_layer.group_send(
+                self.group_name,
+                {"type": "conversa_digitando", "usuario_id": self.usuario_id}
+            )
+
+        elif msg_type == "read":
+            try:
+                ultimo_id = int(data.get("ultimo_id"))
+            except (TypeError, ValueError):
+                return
+            ultimo_id = await self.marcar_lida(ultimo_id)
+            if not ultimo_id:
+                return
+            await self.channel_layer.group_send(
+                self.group_name,
+                {"type": "conversa_lida", "usuario_id": self.usuario_id, "ultimo_id": ultimo_id}
+            )
+
+    async def conversa_mensagem(self, event):
+        await self.send(json.dumps({
+            "type": "mensagem",
+            "mensagem": event["mensagem"]
+        }))
+
+    async def conversa_digitando(self, event):
+        if event["usuario_id"] != self.usuario_id:
+            await self.send(json.dumps({"type": "typing"}))
+
+    async def conversa_lida(self, event):
+        if event["usuario_id"] != self.usuario_id:
+            await self.send(json.dumps({
+                "type": "read",
+                "ultimo_id": event["ultimo_id"]
+            }))
+
+
+class SalaConsumer(AsyncWebsocketConsumer):
+    """Entrega as mensagens novas de uma Sala de clube a quem está com ela aberta.
+
+    O envio continua pelo enviar_mensagem (HTTP), que publica no grupo; o
+    socket só recebe.
+    """
+
+    async def connect(self):
+        self.sala_id = self.scope["url_route"]["kwargs"]["sala_id"]
+        self.group_name = sala_group(self.sala_id)
+        if not await self.sala_existe():
+            await self.close()
+            return
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @database_sync_to_async
+    def sala_existe(self):
+        from .models import Sala
+
+        return Sala.objects.filter(pk=self.sala_id).exists()
+
+    async def sala_mensagem(self, event):
+        await self.send(json.dumps({
+            "type": "mensagem",
+            "mensagem": event["mensagem"]
+        }))
@@ -0,0 +1,163 @@
+"""Montagem do feed da home.
+
+As seções iguais para todo mundo (novidades, tema, clubes mais populares)
+ficam num único item de cache, apagado pelos sinais quando algum desses
+models muda (ver chat/signals.py) e renovado pelo TTL. Os recados recentes
+mudam o tempo todo; ficam num item próprio, só com TTL curto.
+
+As seções por usuário saem de conjuntos pré-calculados: os clubes
+recomendados são os populares do cache menos os que o usuário já segue, e os
+perfis recomendados vêm de um índice invertido gosto -> ids de usuários,
+guardado em cache um item por gosto, com o resultado guardado por usuário.
+O índice é montado fora da request (`manage.py indice_gostos`, de hora em
+hora) e recebe os usuários salvos pelo sinal de Usuario; a request só o monta
+se ele não existir, e uma de cada vez.
+"""
+import hashlib
+from collections import Counter
+
+from django.core.cache import cache
+
+from .amostragem import sortear
+from .matching import normalize_gostos
+from .models import Clube, Novidade, Post, Recado, Tema, Usuario
+
+FEED_CACHE_TTL = 5 * 60
+FEED_RECADOS_TTL = 60
+RECOMENDACOES_TTL = 10 * 60
+# Dura mais que o intervalo do `manage.py indice_gostos`, que o renova antes de vencer
+INDICE_GOSTOS_TTL = 24 * 60 * 60
+# Trava para um único processo remontar o índice quando ele some
+INDICE_GOSTOS_TRAVA_TTL = 60
+
+FEED_GLOBAL_KEY = 'feed:global'
+FEED_RECADOS_KEY = 'feed:recados'
+# Marca de que o índice de gostos foi montado; sem ela, gosto ausente = índice vencido
+FEED_GOSTOS_KEY = 'feed:gostos'
+FEED_GOSTOS_TRAVA_KEY = 'feed:gostos:trava'
+FEED_GOSTO_KEY = 'feed:gosto:{}'
+FEED_PERFIS_KEY = 'feed:perfis:{}'
+
+# Clubes populares guardados; sobra margem para tirar os que o usuário já segue
+CLUBES_CANDIDATOS = 30
+CLUBES_RECOMENDADOS = 5
+PERFIS_RECOMENDADOS = 5
+
+
+def secoes_globais():
+    secoes = cache.get(FEED_GLOBAL_KEY)
+    if secoes is None:
+        secoes = {
+            'novidades': list(Novidade.objects.order_by('-data')[:5]),
+            'tema_semana': Tema.objects.filter(ativo=True).first(),
+            'clubes_populares': list(Clube.objects.order_by('-membros', 'id')[:CLUBES_CANDIDATOS]),
+        }
+        cache.set(FEED_GLOBAL_KEY, secoes, FEED_CACHE_TTL)
+    return secoes
+
+
+def recados_recentes():
+    recados = cache.get(FEED_RECADOS_KEY)
+    if recados is None:
+        recados = list(Recado.objects.select_related('perfil').order_by('-data', '-id')[:10])
+        cache.set(FEED_RECADOS_KEY, recados, FEED_RECADOS_TTL)
+    return recados
+
+
+def invalidar_feed(**kwargs):
+    cache.delete(FEED_GLOBAL_KEY)
+
+
+def chave_gosto(gosto):
+    # Gostos são texto livre; o hash deixa a chave válida em qualquer backend
+    return FEED_GOSTO_KEY.format(hashlib.md5(gosto.encode()).hexdigest())
+
+
+def montar_indice_gostos():
+    """Recalcula o índice gosto -> ids inteiro e grava um item de cache por gosto."""
+    indice = {}
+    for uid, gostos in Usuario.objects.exclude(gostos__isnull=True).values_list('id', 'gostos').iterator():
+        for gosto in set(normalize_gostos(gostos)):
+            indice.setdefault(gosto, []).append(uid)
+    cache.set_many({chave_gosto(g): ids for g, ids in indice.items()}, INDICE_GOSTOS_TTL)
+    cache.set(FEED_GOSTOS_KEY, True, INDICE_GOSTOS_TTL)
+    return indice
+
+
+def indexar_gostos(sender, instance, **kwargs):
+    """Acrescenta o usuário salvo aos itens dos gostos dele.
+
+    Gostos que ele deixou de ter continuam com o id até a próxima montagem
+    completa; para recomendação isso basta. Sem índice montado, não faz nada.
+    """
+    if not cache.get(FEED_GOSTOS_KEY):
+        return
+    gostos = set(normalize_gostos(instance.gostos or []))
+    if not gostos:
+        return
+    chaves = {chave_gosto(g) for g in gostos}
+    achados = cache.get_many(list(chaves))
+    novos = {}
+    for chave in chaves:
+        ids = achados.get(chave, [])
+        if instance.pk not in ids:
+            novos[chave] = ids + [instance.pk]
+    if novos:
+        cache.set_many(novos, INDICE_GOSTOS_TTL)
+
+
+def usuarios_por_gosto(gostos):
+    """{gosto: [ids de usuários]} só dos gostos pedidos, lendo um item por gosto."""
+    chaves = {chave_gosto(g): g for g in gostos}
+    achados = cache.get_many(list(chaves))
+    if (
+        len(achados) < len(chaves)
+        and not cache.get(FEED_GOSTOS_KEY)
+        and cache.add(FEED_GOSTOS_TRAVA_KEY, True, INDICE_GOSTOS_TRAVA_TTL)
+    ):
+        # Índice sumiu (cache reiniciado); quem não pegou a trava segue com o que achou
+        try:
+            indice = montar_indice_gostos()
+        finally:
+            cache.delete(FEED_GOSTOS_TRAVA_KEY)
+        return {g: indice.get(g, []) for g in gostos}
+    return {chaves[chave]: ids for chave, ids in achados.items()}
+
+
+def ids_perfis_recomendados(usuario):
+    chave = FEED_PERFIS_KEY.format(usuario.id)
+    ids = cache.get(chave)
+    if ids is None:
+        gostos = set(normalize_gostos(usuario.gostos))
+        afinidade = Counter()
+        for ids_gosto in usuarios_por_gosto(gostos).values():
+            afinidade.update(ids_gosto)
+        afinidade.pop(usuario.id, None)
+        com_bloqueio = usuario.filtrar_bloqueios(afinidade)
+        ids = [
+            uid for uid, _ in afinidade.most_common() if uid not in com_bloqueio
+        ][:PERFIS_RECOMENDADOS]
+        cache.set(chave, ids, RECOMENDACOES_TTL)
+    return ids
+
+
+def montar_feed(usuario):
+    secoes = secoes_globais()
+
+    ids_clubes = set(usuario.clubes.values_list('id', flat=True))
+    clubes_recomendados = [
+        c for c in secoes['clubes_populares'] if c.id not in ids_clubes
+    ][:CLUBES_RECOMENDADOS]
+
+    ids_perfis = ids_perfis_recomendados(usuario)
+    perfis = Usuario.objects.in_bulk(ids_perfis)
+
+    return {
+        'feed_posts': Post.objects.filter(clube__in=usuario.clubes.all()).select_related('clube', 'autor').order_by('-data')[:10],
+        'recados': recados_recentes(),
+        'perfil_destaque': sortear(Usuario.objects.all(), excluir=[usuario.id]),
+        'tema_semana': secoes['tema_semana'],
+        'clubes_recomendados': clubes_recomendados,
+        'perfis_recomendados': [perfis[i] for i in ids_perfis if i in perfis],
+        'novidades': secoes['novidades'],
+    }
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from chat.feed import montar_indice_gostos
+
+
+class Command(BaseCommand):
+    help = "Monta o índice gosto -> usuários dos perfis recomendados (rodar de hora em hora)."
+
+    def handle(self, *args, **options):
+        indice = montar_indice_gostos()
+        self.stdout.write(f"{len(indice)} gosto(s) indexado(s)")
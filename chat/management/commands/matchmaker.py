@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.matching import InMemoryMatchmaker, MatchScheduler, scheduler_options
+
+
+class Command(BaseCommand):
+    help = "Roda o agendador que pareia a fila do chat aleatório em lote."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick-ms', type=int, help="Intervalo entre rodadas (padrão: MATCHMAKING['SCHEDULER']['TICK_MS'])")
+        parser.add_argument('--once', action='store_true', help="Roda uma única rodada e sai")
+
+    def handle(self, *args, **options):
+        ajustes = {}
+        if options['tick_ms']:
+            ajustes['TICK_MS'] = options['tick_ms']
+        scheduler = MatchScheduler(**ajustes)
+
+        # A fila em memória vive dentro de cada processo web; aqui ela
+        # estaria sempre vazia
+        if isinstance(scheduler.matchmaker, InMemoryMatchmaker):
+            raise CommandError(
+                "MATCHMAKING['BACKEND'] é o InMemoryMatchmaker, cuja fila não é "
+                "compartilhada entre processos; configure o RedisMatchmaker para "
+                "rodar o agendador separado."
+            )
+
+        if options['once']:
+            salas = scheduler.tick()
+            self.stdout.write(f"{salas} sala(s) criada(s)")
+            return
+
+        # Desligado, o find_match pareia sozinho; dois pareando a mesma fila
+        # pulariam a pontuação e o relaxamento do agendador
+        if not scheduler_options()['ENABLED']:
+            raise CommandError(
+                "MATCHMAKING['SCHEDULER']['ENABLED'] está desligado; ligue "
+                "MATCHMAKING_SCHEDULER=True em todos os processos antes de rodar o agendador."
+            )
+        self.stdout.write(f"Pareando a cada {scheduler.options['TICK_MS']} ms")
+        scheduler.run()
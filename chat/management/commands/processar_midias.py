@@ -0,0 +1,22 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from chat.midia_pipeline import CAMPOS_AUDIO, CAMPOS_MIDIA, processar
+
+
+class Command(BaseCommand):
+    help = "Gera as variantes (miniaturas, WebP, áudio normalizado) dos arquivos já enviados."
+
+    def handle(self, *args, **options):
+        total = 0
+        for label, campos in CAMPOS_MIDIA.items():
+            model = apps.get_model(label)
+            for campo in campos:
+                nomes = (
+                    model.objects.exclude(**{f"{campo}__isnull": True}).exclude(**{campo: ""})
+                    .values_list(campo, flat=True).distinct().iterator()
+                )
+                for nome in nomes:
+                    processar(nome, audio=(label, campo) in CAMPOS_AUDIO)
+                    total += 1
+        self.stdout.write(f"{total} arquivo(s) verificado(s)")
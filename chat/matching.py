@@ -1,3 +1,594 @@
 # chat/matching.py
-waiting_users = []
-active_rooms = {}
+# Fila do chat aleatório. O backend é escolhido em settings.MATCHMAKING, no
+# mesmo formato de CHANNEL_LAYERS, para que todos os workers enxerguem a mesma
+# fila quando o backend for compartilhado (Redis).
+import json
+import logging
+import threading
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+# Usuários sem gostos aceitam qualquer parceiro, então ficam num balde próprio
+# que entra em toda busca por gostos.
+TAG_SEM_GOSTOS = 'g:*'
+
+
+def normalize_gostos(gostos_raw):
+    if not gostos_raw:
+        return []
+    if isinstance(gostos_raw, list):
+        return [str(g).strip().lower() for g in gostos_raw if str(g).strip()]
+    if isinstance(gostos_raw, str):
+        try:
+            parsed = json.loads(gostos_raw)
+            if isinstance(parsed, list):
+                return [str(g).strip().lower() for g in parsed if str(g).strip()]
+        except Exception:
+            return [g.strip().lower() for g in gostos_raw.split(",") if g.strip()]
+    return [str(gostos_raw).strip().lower()]
+
+
+def parse_temp_interests(raw):
+    return [g.strip().lower() for g in (raw or '').split(",") if g.strip()]
+
+
+def interest_tags(entry):
+    """Tags sob as quais a entrada fica no índice invertido."""
+    tags = ['g:' + g for g in entry.get('gostos') or []] or [TAG_SEM_GOSTOS]
+    tags += ['t:' + t for t in entry.get('temp_interests') or []]
+    return sorted(set(tags))
+
+
+def lookup_tags(entry):
+    """Tags que um parceiro precisa ter para ser candidato. None = qualquer um.
+
+    Mesmas regras do find_match: gostos temporários precisam coincidir quando
+    usados; gostos fixos só contam quando os dois lados têm algum.
+    """
+    if entry.get('temp_interests'):
+        return ['t:' + t for t in entry['temp_interests']]
+    if entry.get('gostos'):
+        return ['g:' + g for g in entry['gostos']] + [TAG_SEM_GOSTOS]
+    return None
+
+
+def is_compatible(entry, partner):
+    temp = set(entry.get('temp_interests') or [])
+    if temp and not temp & set(partner.get('temp_interests') or []):
+        return False
+    gostos = set(entry.get('gostos') or [])
+    partner_gostos = set(partner.get('gostos') or [])
+    if gostos and partner_gostos and not gostos & partner_gostos:
+        return False
+    return True
+
+
+class BaseMatchmaker:
+    """Interface comum dos backends de fila.
+
+    ``join`` e ``pair`` precisam ser atômicos: um usuário que já tem sala não
+    volta para a fila e dois usuários só são pareados se ambos ainda estiverem
+    esperando.
+    """
+
+    def join(self, session_key, entry):
+        """Coloca (ou atualiza) o usuário na fila. Retorna False se ele já tem sala."""
+        raise NotImplementedError
+
+    def leave(self, session_key):
+        raise NotImplementedError
+
+    def waiting(self, limit=None):
+        """Entradas da fila, da mais antiga para a mais nova."""
+        raise NotImplementedError
+
+    def candidates(self, tags, limit=None):
+        """Entradas que compartilham alguma das tags, da mais antiga para a mais nova.
+
+        Só consulta o índice invertido, então o custo depende de quantos
+        usuários têm as mesmas tags, e não do tamanho da fila.
+        """
+        raise NotImplementedError
+
+    def pair(self, session_a, session_b, room_id):
+        """Tira os dois da fila e associa a sala. Retorna False se algum já saiu."""
+        raise NotImplementedError
+
+    def room_for(self, session_key):
+        raise NotImplementedError
+
+    def clear_room(self, session_key):
+        raise NotImplementedError
+
+
+class InMemoryMatchmaker(BaseMatchmaker):
+    """Fila local ao processo. Só serve com um único worker (dev/testes)."""
+
+    def __init__(self, **config):
+        self._lock = threading.Lock()
+        self._waiting = {}
+        self._index = {}
+        self._rooms = {}
+
+    def _remove(self, session_key):
+        entry = self._waiting.pop(session_key, None)
+        if entry:
+            for tag in entry['tags']:
+                sessions = self._index.get(tag)
+                if sessions is not None:
+                    sessions.discard(session_key)
+                    if not sessions:
+                        del self._index[tag]
+
+    def join(self, session_key, entry):
+        with self._lock:
+            if session_key in self._rooms:
+                return False
+            atual = self._waiting.get(session_key)
+            joined_at = atual['joined_at'] if atual else time.time()
+            self._remove(session_key)
+            entry = dict(entry, session_key=session_key, joined_at=joined_at)
+            entry['tags'] = interest_tags(entry)
+            self._waiting[session_key] = entry
+            for tag in entry['tags']:
+                self._index.setdefault(tag, set()).add(session_key)
+            return True
+
+    def leave(self, session_key):
+        with self._lock:
+            self._remove(session_key)
+            self._rooms.pop(session_key, None)
+
+    def waiting(self, limit=None):
+        with self._lock:
+            return sorted((dict(e) for e in self._waiting.values()), key=lambda e: e['joined_at'])[:limit]
+
+    def candidates(self, tags, limit=None):
+        if tags is None:
+            return self.waiting(limit)
+        with self._lock:
+            sessions = set()
+            for tag in tags:
+                sessions |= self._index.get(tag, set())
+            entries = [dict(self._waiting[s]) for s in sessions]
+        return sorted(entries, key=lambda e: e['joined_at'])[:limit]
+
+    def pair(self, session_a, session_b, room_id):
+        with self._lock:
+            if session_a not in self._waiting or session_b not in self._waiting:
+                return False
+            self._remove(session_a)
+            self._remove(session_b)
+            self._rooms[session_a] = room_id
+            self._rooms[session_b] = room_id
+            return True
+
+    def room_for(self, session_key):
+        return self._rooms.get(session_key)
+
+    def clear_room(self, session_key):
+        with self._lock:
+            self._rooms.pop(session_key, None)
+
+
+class RedisMatchmaker(BaseMatchmaker):
+    """Fila compartilhada no Redis. As operações que mexem em mais de uma chave
+    rodam em scripts Lua, então são atômicas entre todos os workers.
+
+    Chaves: ``<prefix>:entries`` (hash sessão -> entrada JSON),
+    ``<prefix>:order`` (zset por joined_at), ``<prefix>:tag:<tag>`` (set de
+    sessões do índice invertido) e ``<prefix>:room:<sessão>``.
+    """
+
+    # Tira uma sessão da fila e do índice de tags. Todos os scripts recebem o
+    # prefixo das chaves de tag em ARGV[1].
+    REMOVE_LUA = """
+    local function remover(sessao)
+        local dados = redis.call('HGET', KEYS[1], sessao)
+        if dados then
+            for _, tag in ipairs(cjson.decode(dados)['tags']) do
+                redis.call('SREM', ARGV[1] .. tag, sessao)
+            end
+        end
+        redis.call('HDEL', KEYS[1], sessao)
+        redis.call('ZREM', KEYS[2], sessao)
+    end
+    """
+
+    JOIN_SCRIPT = REMOVE_LUA + """
+    if redis.call('EXISTS', KEYS[3]) == 1 then
+        return 0
+    end
+    local score = redis.call('ZSCORE', KEYS[2], ARGV[2]) or ARGV[4]
+    remover(ARGV[2])
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('ZADD', KEYS[2], score, ARGV[2])
+    for i = 5, #ARGV do
+        redis.call('SADD', ARGV[1] .. ARGV[i], ARGV[2])
+    end
+    return 1
+    """
+
+    LEAVE_SCRIPT = REMOVE_LUA + """
+    remover(ARGV[2])
+    redis.call('DEL', KEYS[3])
+    return 1
+    """
+
+    PAIR_SCRIPT = REMOVE_LUA + """
+    if redis.call('HEXISTS', KEYS[1], ARGV[2]) == 0 or redis.call('HEXISTS', KEYS[1], ARGV[3]) == 0 then
+        return 0
+    end
+    remover(ARGV[2])
+    remover(ARGV[3])
+    redis.call('SET', KEYS[3], ARGV[4], 'EX', ARGV[5])
+    redis.call('SET', KEYS[4], ARGV[4], 'EX', ARGV[5])
+    return 1
+    """
+
+    def __init__(self, url='redis://localhost:6379', prefix='coffee:match', room_ttl=6 * 60 * 60):
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.room_ttl = room_ttl
+        self._join = self.redis.register_script(self.JOIN_SCRIPT)
+        self._leave = self.redis.register_script(self.LEAVE_SCRIPT)
+        self._pair = self.redis.register_script(self.PAIR_SCRIPT)
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    @property
+    def _entries_key(self):
+        return self._key('entries')
+
+    @property
+    def _order_key(self):
+        return self._key('order')
+
+    @property
+    def _tag_prefix(self):
+        return self._key('tag', '')
+
+    def _room_key(self, session_key):
+        return self._key('room', session_key)
+
+    def _load(self, sessions, limit=None):
+        if not sessions:
+            return []
+        dados = self.redis.hmget(self._entries_key, sessions)
+        entries = sorted((json.loads(d) for d in dados if d), key=lambda e: e['joined_at'])
+        return entries[:limit]
+
+    def join(self, session_key, entry):
+        # joined_at é o score no zset: quem atualiza os interesses não perde a vez
+        joined_at = self.redis.zscore(self._order_key, session_key) or time.time()
+        entry = dict(entry, session_key=session_key, joined_at=joined_at)
+        entry['tags'] = interest_tags(entry)
+        return bool(self._join(
+            keys=[self._entries_key, self._order_key, self._room_key(session_key)],
+            args=[self._tag_prefix, session_key, json.dumps(entry), joined_at] + entry['tags'],
+        ))
+
+    def leave(self, session_key):
+        self._leave(
+            keys=[self._entries_key, self._order_key, self._room_key(session_key)],
+            args=[self._tag_prefix, session_key],
+        )
+
+    def waiting(self, limit=None):
+        fim = -1 if limit is None else limit - 1
+        return self._load(self.redis.zrange(self._order_key, 0, fim))
+
+    def candidates(self, tags, limit=None):
+        if tags is None:
+            return self.waiting(limit)
+        chaves = [self._tag_prefix + tag for tag in tags]
+        if limit is None:
+            return self._load(list(self.redis.sunion(chaves)))
+        # Tags populares (um gosto comum) podem ter a fila quase toda; cada set
+        # contribui com no máximo ``limit`` sessões sorteadas, e só essas são
+        # carregadas do hash
+        pipe = self.redis.pipeline(transaction=False)
+        for chave in chaves:
+            pipe.srandmember(chave, limit)
+        sessions = set()
+        for amostra in pipe.execute():
+            sessions.update(amostra)
+        return self._load(list(sessions), limit)
+
+    def pair(self, session_a, session_b, room_id):
+        return bool(self._pair(
+            keys=[self._entries_key, self._order_key, self._room_key(session_a), self._room_key(session_b)],
+            args=[self._tag_prefix, session_a, session_b, room_id, self.room_ttl],
+        ))
+
+    def room_for(self, session_key):
+        return self.redis.get(self._room_key(session_key))
+
+    def clear_room(self, session_key):
+        self.redis.delete(self._room_key(session_key))
+
+
+_matchmaker = None
+_matchmaker_lock = threading.Lock()
+
+
+def get_matchmaker():
+    global _matchmaker
+    if _matchmaker is None:
+        with _matchmaker_lock:
+            if _matchmaker is None:
+                conf = getattr(settings, 'MATCHMAKING', {})
+                backend = import_string(conf.get('BACKEND', 'chat.matching.InMemoryMatchmaker'))
+                _matchmaker = backend(**conf.get('CONFIG', {}))
+    return _matchmaker
+
+
+# ------------------------------
+# Pareamento
+# ------------------------------
+
+# Quantos candidatos do índice de interesses são avaliados por tentativa
+MATCH_CANDIDATE_LIMIT = 50
+
+
+def match_group(session_key):
+    """Grupo do channel layer onde o MatchConsumer de uma sessão escuta."""
+    return f"match_{session_key}"
+
+
+def notify_match(session_key, room_id):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        match_group(session_key),
+        {"type": "match_found", "room_id": room_id},
+    )
+
+
+def build_entry(usuario, temp_interests):
+    # Os gostos vão normalizados na entrada, então os candidatos não precisam
+    # ir ao banco para serem comparados.
+    return {
+        'usuario_id': usuario.id,
+        'gostos': normalize_gostos(usuario.gostos),
+        'temp_interests': temp_interests,
+        'localizacao': (usuario.localizacao or '').strip().lower(),
+    }
+
+
+def create_room(matchmaker, session_a, session_b):
+    """Cria a ChatRoom e pareia. Retorna None se algum dos dois já saiu da fila."""
+    from .models import ChatRoom
+
+    # A sala existe antes do pareamento para que o parceiro, ao ser avisado,
+    # já a encontre no chat_view.
+    room_id = str(uuid.uuid4())[:8]
+    room = ChatRoom.objects.create(id=room_id, user1=session_a, user2=session_b)
+    if matchmaker.pair(session_a, session_b, room_id):
+        return room_id
+    room.delete()
+    return None
+
+
+def find_partner(session_key, usuario, temp_interests):
+    """Coloca a sessão na fila e tenta parear agora (a menos que o pareamento
+    em lote esteja ligado).
+
+    Retorna o room_id (novo ou já existente) ou None se ainda não há parceiro.
+    O parceiro é avisado pelo channel layer, caso esteja esperando no socket.
+    """
+    from .models import Usuario
+
+    matchmaker = get_matchmaker()
+
+    # Se já está em sala ativa, retorna imediatamente
+    room_id = matchmaker.room_for(session_key)
+    if room_id:
+        return room_id
+
+    entry = build_entry(usuario, temp_interests)
+    if not matchmaker.join(session_key, entry):
+        return matchmaker.room_for(session_key)
+
+    # Com o agendador ligado só ele pareia; aqui basta entrar na fila
+    if scheduler_options()['ENABLED']:
+        return None
+
+    # Só olha quem compartilha alguma tag (índice invertido), exceto ele mesmo
+    candidatos = [
+        w for w in matchmaker.candidates(lookup_tags(entry), limit=MATCH_CANDIDATE_LIMIT + 1)
+        if w['session_key'] != session_key and is_compatible(entry, w)
+    ][:MATCH_CANDIDATE_LIMIT]
+    if not candidatos:
+        return None
+
+    ids = [w['usuario_id'] for w in candidatos]
+    partner_users = Usuario.objects.in_bulk(ids)
+    bloqueios = usuario.filtrar_bloqueios(ids)
+
+    for w in candidatos:
+        partner_user = partner_users.get(w['usuario_id'])
+        if not partner_user or partner_user.session_key != w['session_key']:
+            continue
+
+        # Ignora se há bloqueio em qualquer direção
+        if partner_user.id in bloqueios:
+            continue
+
+        # O pareamento é atômico no backend: se outro worker pegou o parceiro
+        # (ou este usuário) primeiro, tenta o próximo candidato.
+        new_room_id = create_room(matchmaker, session_key, w['session_key'])
+        if new_room_id:
+            notify_match(w['session_key'], new_room_id)
+            return new_room_id
+
+        room_id = matchmaker.room_for(session_key)
+        if room_id:
+            return room_id
+
+    return None
+
+
+# ------------------------------
+# Pareamento em lote
+# ------------------------------
+
+DEFAULT_SCHEDULER = {
+    'ENABLED': False,
+    # Intervalo entre rodadas do agendador
+    'TICK_MS': 500,
+    # Até aqui, exige mesma localização quando os dois informaram uma
+    'LOCATION_STRICT_SECONDS': 10,
+    # Depois disso, aceita parceiro mesmo sem interesse em comum
+    'RELAX_INTERESTS_SECONDS': 30,
+    # Cada WAIT_WEIGHT_SECONDS de espera vale o mesmo que um gosto em comum
+    'WAIT_WEIGHT_SECONDS': 10,
+}
+
+
+def scheduler_options():
+    return dict(DEFAULT_SCHEDULER, **getattr(settings, 'MATCHMAKING', {}).get('SCHEDULER', {}))
+
+
+class MatchScheduler:
+    """Pareia a fila inteira a cada rodada, escolhendo os melhores pares.
+
+    Cada rodada monta as arestas possíveis (pelo índice de tags, como o
+    find_partner), pontua por interesses em comum, localização e tempo de
+    espera e faz um emparelhamento guloso pelas maiores notas. Quanto mais
+    alguém espera, mais frouxas ficam as regras que ele exige do parceiro.
+    """
+
+    def __init__(self, matchmaker=None, **options):
+        self.matchmaker = matchmaker or get_matchmaker()
+        self.options = dict(scheduler_options(), **options)
+
+    def relax_level(self, entry, agora):
+        espera = agora - entry['joined_at']
+        if espera < self.options['LOCATION_STRICT_SECONDS']:
+            return 0
+        if espera < self.options['RELAX_INTERESTS_SECONDS']:
+            return 1
+        return 2
+
+    def accepts(self, entry, partner, level):
+        if level >= 2:
+            return True
+        if not is_compatible(entry, partner):
+            return False
+        loc, partner_loc = entry.get('localizacao'), partner.get('localizacao')
+        if level == 0 and loc and partner_loc and loc != partner_loc:
+            return False
+        return True
+
+    def score(self, a, b, agora):
+        comum_temp = set(a.get('temp_interests') or []) & set(b.get('temp_interests') or [])
+        comum_gostos = set(a.get('gostos') or []) & set(b.get('gostos') or [])
+        nota = 2 * len(comum_temp) + len(comum_gostos)
+        if a.get('localizacao') and a.get('localizacao') == b.get('localizacao'):
+            nota += 1
+        espera = (agora - a['joined_at']) + (agora - b['joined_at'])
+        return nota + espera / self.options['WAIT_WEIGHT_SECONDS']
+
+    def blocked_pairs(self, usuario_ids):
+        from .models import Usuario
+
+        bloqueios = Usuario.bloqueados.through.objects.filter(
+            from_usuario_id__in=usuario_ids, to_usuario_id__in=usuario_ids,
+        ).values_list('from_usuario_id', 'to_usuario_id')
+        return {frozenset(par) for par in bloqueios}
+
+    def candidate_pairs(self, entries, agora):
+        """Arestas (nota, a, b) entre entradas que se aceitam mutuamente."""
+        index = {}
+        for entry in entries:
+            for tag in entry['tags']:
+                index.setdefault(tag, []).append(entry)
+
+        bloqueados = self.blocked_pairs([e['usuario_id'] for e in entries])
+        levels = {e['session_key']: self.relax_level(e, agora) for e in entries}
+
+        arestas = {}
+        for entry in entries:
+            level = levels[entry['session_key']]
+            tags = lookup_tags(entry) if level < 2 else None
+            if tags is None:
+                candidatos = entries[:MATCH_CANDIDATE_LIMIT + 1]
+            else:
+                candidatos = [c for tag in tags for c in index.get(tag, ())]
+
+            for partner in candidatos:
+                chave = tuple(sorted((entry['session_key'], partner['session_key'])))
+                if chave[0] == chave[1] or chave in arestas:
+                    continue
+                if frozenset((entry['usuario_id'], partner['usuario_id'])) in bloqueados:
+                    continue
+                if not self.accepts(entry, partner, level):
+                    continue
+                if not self.accepts(partner, entry, levels[partner['session_key']]):
+                    continue
+                arestas[chave] = (self.score(entry, partner, agora), entry, partner)
+
+        return sorted(arestas.values(), key=lambda aresta: aresta[0], reverse=True)
+
+    def tick(self):
+        """Roda uma rodada de pareamento. Retorna quantas salas foram criadas."""
+        from .models import Usuario
+
+        entries = [e for e in self.matchmaker.waiting() if e.get('usuario_id')]
+        if len(entries) < 2:
+            return 0
+
+        # Descarta entradas de sessões que não pertencem mais ao usuário
+        usuarios = Usuario.objects.in_bulk([e['usuario_id'] for e in entries])
+        entries = [
+            e for e in entries
+            if e['usuario_id'] in usuarios and usuarios[e['usuario_id']].session_key == e['session_key']
+        ]
+
+        agora = time.time()
+        usados = set()
+        salas = 0
+        for _, a, b in self.candidate_pairs(entries, agora):
+            if a['session_key'] in usados or b['session_key'] in usados:
+                continue
+            # Se o par não sair (alguém saiu da fila ou o pair falhou), os dois
+            # continuam disponíveis para as próximas arestas da rodada
+            try:
+                room_id = create_room(self.matchmaker, a['session_key'], b['session_key'])
+                if not room_id:
+                    continue
+                notify_match(a['session_key'], room_id)
+                notify_match(b['session_key'], room_id)
+            except Exception:
+                logger.exception("Falha ao parear %s com %s", a['session_key'], b['session_key'])
+                continue
+            usados.update((a['session_key'], b['session_key']))
+            salas += 1
+        return salas
+
+    def run(self):
+        from django.db import close_old_connections
+
+        intervalo = self.options['TICK_MS'] / 1000
+        while True:
+            inicio = time.monotonic()
+            close_old_connections()
+            try:
+                self.tick()
+            except Exception:
+                # Uma rodada com erro (Redis ou banco fora do ar) não derruba o agendador
+                logger.exception("Rodada do agendador falhou")
+            time.sleep(max(0, intervalo - (time.monotonic() - inicio)))
@@ -0,0 +1,131 @@
+"""Mídia efêmera do chat aleatório.
+
+Os arquivos ficam em ``MEDIA_ROOT/chat_aleatorio/<room_id>/`` com o nome dado
+pelo sha256 do conteúdo (``<sha256><ext>``): o mesmo arquivo enviado duas vezes
+na sala ocupa o disco uma vez só, e o id curto é tudo o que passa pelo socket
+e pelo channel layer. A pasta da sala é apagada junto com o ``ChatRoom``.
+
+O envio é um POST com o arquivo como corpo (``chat_media_upload``), gravado
+em disco pedaço a pedaço; pelo socket passa só ``{"type": "media", "media_id"}``.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import uuid
+
+from django.conf import settings
+
+from .uploads import limite_upload
+
+# Tamanho de cada leitura do corpo do upload
+CHUNK_SIZE = 64 * 1024
+
+MEDIA_TIPOS = ("image/", "audio/", "video/")
+
+MEDIA_DIR = "chat_aleatorio"
+MEDIA_ID_RE = re.compile(r"^[0-9a-f]{64}(\.\w{1,10})?$")
+
+
+class MediaError(Exception):
+    pass
+
+
+class MediaGrandeDemais(MediaError):
+    pass
+
+
+def sala_media_dir(room_id):
+    return os.path.join(settings.MEDIA_ROOT, MEDIA_DIR, room_id)
+
+
+def nome_seguro(filename):
+    nome = os.path.basename(filename or "")
+    nome = re.sub(r"[^\w.-]", "_", nome)[-80:]
+    return nome or "arquivo"
+
+
+def validar_tipo(content_type):
+    if not content_type or not content_type.startswith(MEDIA_TIPOS):
+        raise MediaError("Tipo de arquivo não suportado")
+
+
+def media_url(room_id, media_id):
+    return f"{settings.MEDIA_URL}{MEDIA_DIR}/{room_id}/{media_id}"
+
+
+def media_content_type(media_id):
+    return mimetypes.guess_type(media_id)[0] or "application/octet-stream"
+
+
+def media_existe(room_id, media_id):
+    if not media_id or not MEDIA_ID_RE.match(media_id):
+        return False
+    return os.path.isfile(os.path.join(sala_media_dir(room_id), media_id))
+
+
+def descartar_midia_sala(room_id):
+    shutil.rmtree(sala_media_dir(room_id), ignore_errors=True)
+
+
+class EscritaMidia:
+    """Grava um arquivo da sala em pedaços, calculando o sha256 no caminho.
+
+    O conteúdo vai para um ``.part`` temporário e só ganha o nome definitivo
+    em ``concluir``; se o mesmo conteúdo já existe na sala, o temporário é
+    descartado.
+    """
+
+    def __init__(self, room_id, content_type, max_bytes=None):
+        validar_tipo(content_type)
+        self.room_id = room_id
+        self.content_type = content_type
+        self.max_bytes = max_bytes or limite_upload(content_type)
+        self.recebido = 0
+        self._hash = hashlib.sha256()
+
+        self.pasta = sala_media_dir(room_id)
+        os.makedirs(self.pasta, exist_ok=True)
+        self._temp = os.path.join(self.pasta, f".{uuid.uuid4().hex}.part")
+        self._arquivo = open(self._temp, "wb")
+
+    def escrever(self, dados):
+        if self.recebido + len(dados) > self.max_bytes:
+            raise MediaGrandeDemais("Arquivo muito grande")
+        self._arquivo.write(dados)
+        self._hash.update(dados)
+        self.recebido += len(dados)
+
+    def concluir(self):
+        self._arquivo.close()
+        ext = mimetypes.guess_extension(self.content_type) or ""
+        media_id = self._hash.hexdigest() + ext
+        destino = os.path.join(self.pasta, media_id)
+        if os.path.exists(destino):
+            os.remove(self._temp)
+        else:
+            os.replace(self._temp, destino)
+        return media_id
+
+    def descartar(self):
+        self._arquivo.close()
+        try:
+            os.remove(self._temp)
+        except FileNotFoundError:
+            pass
+
+
+def salvar_midia(room_id, content_type, partes):
+    """Grava os pedaços de ``partes`` na sala e devolve o media_id."""
+    escrita = EscritaMidia(room_id, content_type)
+    try:
+        for dados in partes:
+            escrita.escrever(dados)
+        if not escrita.recebido:
+            raise MediaError("Arquivo vazio")
+    except BaseException:
+        escrita.descartar()
+        raise
+    return escrita.concluir()
+
@@ -0,0 +1,38 @@
+from django.utils.functional import SimpleLazyObject
+
+from .models import Usuario
+
+
+def usuario_da_sessao(sessao):
+    """Usuário logado de uma sessão (da request ou do scope de um socket).
+
+    Procura pelo usuario_id da sessão, depois pelo usuario_id_map que o
+    login_view guarda na sessão, e por fim pela session_key gravada no
+    Usuario (indexada).
+    """
+    session_key = sessao.session_key
+    usuario_id = sessao.get('usuario_id') or sessao.get('usuario_id_map', {}).get(session_key)
+
+    if usuario_id:
+        return Usuario.objects.filter(id=usuario_id).first()
+    if session_key:
+        return Usuario.objects.filter(session_key=session_key).first()
+    return None
+
+
+def usuario_da_request(request):
+    """Usuário logado da request, buscado no banco no máximo uma vez."""
+    if not hasattr(request, '_usuario_cache'):
+        request._usuario_cache = usuario_da_sessao(request.session)
+    return request._usuario_cache
+
+
+class UsuarioMiddleware:
+    """Expõe ``request.usuario`` (ou None), resolvido só quando usado."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.usuario = SimpleLazyObject(lambda: usuario_da_request(request))
+        return self.get_response(request)
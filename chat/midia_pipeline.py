@@ -0,0 +1,185 @@
+"""Processamento de mídia em segundo plano.
+
+Depois que um arquivo é salvo (``post_save`` + ``on_commit``, ver
+chat/signals.py), o nome dele vai para um pool de threads local que gera:
+
+- imagens: miniatura e versão reduzida, ambas em WebP (Pillow);
+- áudios: versão mono normalizada em AAC, se houver ``ffmpeg`` no PATH.
+
+As variantes ficam registradas em ``MidiaVariante``; as views usam
+``anexar_variantes`` para servir a menor versão adequada e caem no original
+enquanto a variante não existe.
+"""
+import io
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from .models import MidiaVariante
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PIPELINE = {
+    "ENABLED": True,
+    "WORKERS": 2,
+    # Lado maior, em pixels
+    "THUMB_PX": 320,
+    "MAX_PX": 1600,
+    "WEBP_QUALITY": 80,
+    # Imagens maiores que isso (depois do draft do JPEG) não são decodificadas
+    "MAX_PIXELS": 40_000_000,
+    "FFMPEG_TIMEOUT": 120,
+}
+
+# Campos de arquivo processados, por model (app_label.Model)
+CAMPOS_MIDIA = {
+    "chat.Mensagem": ("midia", "audio"),
+    "chat.Topico": ("arquivo_midia",),
+    "chat.Evento": ("banner",),
+}
+# Campos que são sempre áudio, seja qual for a extensão (gravação do navegador vem em .webm)
+CAMPOS_AUDIO = {("chat.Mensagem", "audio")}
+
+
+def pipeline_options():
+    return {**DEFAULT_PIPELINE, **getattr(settings, "MEDIA_PIPELINE", {})}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=pipeline_options()["WORKERS"],
+                    thread_name_prefix="midia",
+                )
+    return _executor
+
+
+def agendar(nome, audio=False):
+    """Processa o arquivo depois do commit, fora da request."""
+    if not nome or not pipeline_options()["ENABLED"]:
+        return
+    transaction.on_commit(lambda: get_executor().submit(processar, nome, audio))
+
+
+def processar(nome, audio=False):
+    close_old_connections()
+    try:
+        tipo = mimetypes.guess_type(nome)[0] or ""
+        if audio or tipo.startswith("audio/"):
+            processar_audio(nome)
+        elif tipo.startswith("image/"):
+            processar_imagem(nome)
+    except Exception:
+        logger.exception("Falha ao processar mídia %s", nome)
+    finally:
+        close_old_connections()
+
+
+def nome_variante(nome, tipo, ext):
+    base, _ = os.path.splitext(nome)
+    return f"variantes/{base}.{tipo}{ext}"
+
+
+def salvar_variante(nome, tipo, conteudo, ext, largura=None, altura=None):
+    arquivo = default_storage.save(nome_variante(nome, tipo, ext), conteudo)
+    MidiaVariante.objects.update_or_create(
+        original=nome, tipo=tipo,
+        defaults={
+            "arquivo": arquivo,
+            "largura": largura,
+            "altura": altura,
+            "tamanho": default_storage.size(arquivo),
+        },
+    )
+
+
+def processar_imagem(nome):
+    from PIL import Image, ImageOps
+
+    feitas = set(MidiaVariante.objects.filter(original=nome).values_list("tipo", flat=True))
+    pendentes = [
+        (tipo, px) for tipo, px in (
+            (MidiaVariante.WEBP, pipeline_options()["MAX_PX"]),
+            (MidiaVariante.THUMB, pipeline_options()["THUMB_PX"]),
+        ) if tipo not in feitas
+    ]
+    if not pendentes:
+        return
+
+    with default_storage.open(nome, "rb") as f:
+        img = Image.open(f)
+        # GIF animado perderia a animação
+        if getattr(img, "is_animated", False):
+            return
+        # JPEG já decodifica reduzido (1/2, 1/4, 1/8), sem passar do maior tamanho pedido
+        img.draft("RGB", (pendentes[0][1], pendentes[0][1]))
+        largura, altura = img.size
+        if largura * altura > pipeline_options()["MAX_PIXELS"]:
+            logger.warning("Imagem %s grande demais (%sx%s); variantes não geradas", nome, largura, altura)
+            return
+        img = ImageOps.exif_transpose(img)
+        img.load()
+
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+
+    # Da maior para a menor, reaproveitando a redução anterior
+    for tipo, px in pendentes:
+        img.thumbnail((px, px), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, "WEBP", quality=pipeline_options()["WEBP_QUALITY"], method=4)
+        salvar_variante(nome, tipo, ContentFile(buf.getvalue()), ".webp", *img.size)
+
+
+def processar_audio(nome):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return
+    if MidiaVariante.objects.filter(original=nome, tipo=MidiaVariante.AUDIO).exists():
+        return
+
+    with tempfile.TemporaryDirectory() as pasta:
+        entrada = os.path.join(pasta, "entrada")
+        saida = os.path.join(pasta, "saida.m4a")
+        with default_storage.open(nome, "rb") as origem, open(entrada, "wb") as destino:
+            shutil.copyfileobj(origem, destino)
+
+        subprocess.run(
+            [ffmpeg, "-nostdin", "-y", "-v", "error", "-i", entrada,
+             "-vn", "-ac", "1", "-ar", "48000", "-af", "loudnorm",
+             "-c:a", "aac", "-b:a", "64k", saida],
+            check=True,
+            timeout=pipeline_options()["FFMPEG_TIMEOUT"],
+        )
+        with open(saida, "rb") as f:
+            salvar_variante(nome, MidiaVariante.AUDIO, File(f), ".m4a")
+
+
+def anexar_variantes(objetos, *campos):
+    """Preenche ``obj.variantes[campo][tipo] = url`` com uma consulta só."""
+    objetos = list(objetos)
+    nomes = [getattr(obj, campo).name for obj in objetos for campo in campos if getattr(obj, campo)]
+    urls = MidiaVariante.urls_para(nomes)
+    for obj in objetos:
+        obj.variantes = {
+            campo: urls.get(getattr(obj, campo).name, {}) if getattr(obj, campo) else {}
+            for campo in campos
+        }
+    return objetos
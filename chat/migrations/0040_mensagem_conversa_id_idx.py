@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0039_wplacestate_delete_wplacedrawing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mensagem',
+            index=models.Index(fields=['conversation', 'id'], name='mensagem_conversa_id_idx'),
+        ),
+    ]
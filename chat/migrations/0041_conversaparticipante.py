@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def preencher_lido_ate(apps, schema_editor):
+    # A marca de cada participante é a maior mensagem que ele já tinha em visto_por
+    Mensagem = apps.get_model('chat', 'Mensagem')
+    ConversaParticipante = apps.get_model('chat', 'ConversaParticipante')
+    Visto = Mensagem.visto_por.through
+
+    marcas = (
+        Visto.objects.filter(mensagem__conversation__isnull=False)
+        .values('mensagem__conversation_id', 'usuario_id')
+        .annotate(lido_ate=Max('mensagem_id'))
+    )
+    ConversaParticipante.objects.bulk_create(
+        [
+            ConversaParticipante(
+                conversation_id=m['mensagem__conversation_id'],
+                usuario_id=m['usuario_id'],
+                lido_ate=m['lido_ate'],
+            )
+            for m in marcas
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0040_mensagem_conversa_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversaParticipante',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lido_ate', models.BigIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participantes', to='chat.conversation')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participacoes', to='chat.usuario')),
+            ],
+            options={
+                'unique_together': {('conversation', 'usuario')},
+            },
+        ),
+        migrations.RunPython(preencher_lido_ate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_caixa_entrada(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversaParticipante = apps.get_model('chat', 'ConversaParticipante')
+
+    for conv in Conversation.objects.all().iterator():
+        ultima = conv.mensagens.order_by('-id').first()
+        if not ultima:
+            continue
+        for usuario_id, amigo_id in ((conv.user1_id, conv.user2_id), (conv.user2_id, conv.user1_id)):
+            participante, _ = ConversaParticipante.objects.get_or_create(
+                conversation=conv, usuario_id=usuario_id
+            )
+            participante.amigo_id = amigo_id
+            participante.ultima_mensagem = ultima
+            participante.preview = (ultima.conteudo or "(mídia ou áudio)")[:100]
+            participante.atualizado_em = ultima.timestamp
+            participante.nao_lidas = conv.mensagens.filter(
+                id__gt=participante.lido_ate
+            ).exclude(remetente_id=usuario_id).count()
+            participante.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0041_conversaparticipante'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversaparticipante',
+            name='amigo',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chat.usuario'),
+        ),
+        migrations.AddField(
+            model_name='conversaparticipante',
+            name='atualizado_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversaparticipante',
+            name='nao_lidas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversaparticipante',
+            name='preview',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversaparticipante',
+            name='ultima_mensagem',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.mensagem'),
+        ),
+        migrations.AddIndex(
+            model_name='conversaparticipante',
+            index=models.Index(fields=['usuario', '-atualizado_em'], name='caixa_entrada_idx'),
+        ),
+        migrations.RunPython(preencher_caixa_entrada, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0042_caixa_entrada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salamensagem',
+            index=models.Index(fields=['sala', 'criado_em', 'id'], name='salamensagem_janela_idx'),
+        ),
+    ]
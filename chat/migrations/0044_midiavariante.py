@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0043_salamensagem_janela_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MidiaVariante',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original', models.CharField(db_index=True, max_length=255)),
+                ('tipo', models.CharField(choices=[('thumb', 'Miniatura'), ('webp', 'Imagem WebP'), ('audio', 'Áudio normalizado')], max_length=10)),
+                ('arquivo', models.FileField(upload_to='variantes/')),
+                ('largura', models.PositiveIntegerField(blank=True, null=True)),
+                ('altura', models.PositiveIntegerField(blank=True, null=True)),
+                ('tamanho', models.PositiveIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('original', 'tipo')},
+            },
+        ),
+    ]
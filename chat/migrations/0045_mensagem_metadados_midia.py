@@ -0,0 +1,77 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:43
+
+import mimetypes
+import os
+
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models
+
+
+def tipo_midia(content_type):
+    if not content_type:
+        return ''
+    if content_type.startswith('image'):
+        return 'imagem'
+    if content_type.startswith('video'):
+        return 'video'
+    if content_type.startswith('application'):
+        return 'documento'
+    return 'outro'
+
+
+def preencher_metadados(apps, schema_editor):
+    Mensagem = apps.get_model('chat', 'Mensagem')
+
+    lote = []
+    for msg in Mensagem.objects.exclude(midia='').exclude(midia__isnull=True).iterator():
+        msg.midia_tipo = tipo_midia(mimetypes.guess_type(msg.midia.name)[0])
+        msg.midia_nome = os.path.basename(msg.midia.name)
+        try:
+            msg.midia_tamanho = msg.midia.size
+            if msg.midia_tipo == 'imagem':
+                msg.midia_largura, msg.midia_altura = get_image_dimensions(msg.midia)
+        except (OSError, ValueError):
+            # Arquivo sumiu do storage: fica só com tipo e nome
+            pass
+        lote.append(msg)
+        if len(lote) >= 500:
+            Mensagem.objects.bulk_update(lote, ['midia_tipo', 'midia_nome', 'midia_tamanho', 'midia_largura', 'midia_altura'])
+            lote = []
+    if lote:
+        Mensagem.objects.bulk_update(lote, ['midia_tipo', 'midia_nome', 'midia_tamanho', 'midia_largura', 'midia_altura'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0044_midiavariante'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mensagem',
+            name='midia_altura',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mensagem',
+            name='midia_largura',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mensagem',
+            name='midia_nome',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='mensagem',
+            name='midia_tamanho',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mensagem',
+            name='midia_tipo',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.RunPython(preencher_metadados, migrations.RunPython.noop),
+    ]
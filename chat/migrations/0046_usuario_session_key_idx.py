@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0045_mensagem_metadados_midia'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usuario',
+            name='session_key',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:46
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalizar_nome(nome):
+    sem_acento = unicodedata.normalize('NFKD', nome or '')
+    sem_acento = ''.join(c for c in sem_acento if not unicodedata.combining(c))
+    return ' '.join(sem_acento.casefold().split())
+
+
+def preencher_nome_busca(apps, schema_editor):
+    Usuario = apps.get_model('chat', 'Usuario')
+
+    lote = []
+    for usuario in Usuario.objects.only('id', 'nome').iterator():
+        usuario.nome_busca = normalizar_nome(usuario.nome)
+        lote.append(usuario)
+        if len(lote) >= 500:
+            Usuario.objects.bulk_update(lote, ['nome_busca'])
+            lote = []
+    if lote:
+        Usuario.objects.bulk_update(lote, ['nome_busca'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0046_usuario_session_key_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='nome_busca',
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+        migrations.RunPython(preencher_nome_busca, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['nome_busca', 'id'], name='usuario_diretorio_idx'),
+        ),
+    ]
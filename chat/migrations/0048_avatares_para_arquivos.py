@@ -0,0 +1,95 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:20
+
+import base64
+import binascii
+import hashlib
+import io
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+# Cópia do chat/avatares.py na época desta migração; não importar o módulo vivo
+AVATAR_DIR = 'avatares'
+AVATAR_PX = 256
+AVATAR_MINI_PX = 64
+AVATAR_MAX_BYTES = 10 * 1024 * 1024
+
+DATA_URL_RE = re.compile(r'^data:(image/[\w.+-]+);base64,(.*)$', re.S)
+
+
+class AvatarError(Exception):
+    pass
+
+
+def caminho_avatar(digest, mini=False):
+    return f"{AVATAR_DIR}/{digest}{'_mini' if mini else ''}.webp"
+
+
+def gravar_variantes(bruto, digest):
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        img = Image.open(io.BytesIO(bruto))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise AvatarError("Foto inválida")
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+
+    for px, mini in ((AVATAR_PX, False), (AVATAR_MINI_PX, True)):
+        img.thumbnail((px, px), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, 'WEBP', quality=85)
+        caminho = caminho_avatar(digest, mini)
+        if not default_storage.exists(caminho):
+            default_storage.save(caminho, ContentFile(buf.getvalue()))
+
+
+def salvar_avatar(valor, mini):
+    casamento = DATA_URL_RE.match(valor)
+    if not casamento:
+        raise AvatarError("Foto inválida")
+    dados = casamento.group(2)
+    if len(dados) * 3 // 4 > AVATAR_MAX_BYTES:
+        raise AvatarError("Foto muito grande")
+    try:
+        bruto = base64.b64decode(dados)
+    except (binascii.Error, ValueError):
+        raise AvatarError("Foto inválida")
+
+    digest = hashlib.sha256(bruto).hexdigest()
+    if not default_storage.exists(caminho_avatar(digest)):
+        gravar_variantes(bruto, digest)
+    return default_storage.url(caminho_avatar(digest, mini))
+
+
+def converter(model, campo, mini):
+    """Troca os data URLs de model.campo pela URL do avatar gravado."""
+    linhas = model.objects.filter(**{f'{campo}__startswith': 'data:'}).only('id', campo)
+    for linha in linhas.iterator(chunk_size=50):
+        try:
+            url = salvar_avatar(getattr(linha, campo), mini)
+        except AvatarError:
+            # Imagem corrompida: melhor sem foto do que com o blob
+            url = None
+        model.objects.filter(id=linha.id).update(**{campo: url})
+
+
+def avatares_para_arquivos(apps, schema_editor):
+    converter(apps.get_model('chat', 'Usuario'), 'foto', mini=False)
+    converter(apps.get_model('chat', 'Recado'), 'foto', mini=True)
+    converter(apps.get_model('chat', 'SolicitacaoClube'), 'foto_url', mini=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0047_usuario_nome_busca'),
+    ]
+
+    operations = [
+        migrations.RunPython(avatares_para_arquivos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0048_avatares_para_arquivos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recado',
+            index=models.Index(fields=['perfil', 'data', 'id'], name='recado_mural_idx'),
+        ),
+    ]
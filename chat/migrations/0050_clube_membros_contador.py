@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:02
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def recontar_membros(apps, schema_editor):
+    Clube = apps.get_model('chat', 'Clube')
+
+    lote = []
+    for clube in Clube.objects.annotate(total=Count('usuario')).only('id', 'membros').iterator():
+        if clube.membros != clube.total:
+            clube.membros = clube.total
+            lote.append(clube)
+        if len(lote) >= 500:
+            Clube.objects.bulk_update(lote, ['membros'])
+            lote = []
+    if lote:
+        Clube.objects.bulk_update(lote, ['membros'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0049_recado_mural_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clube',
+            name='membros',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(recontar_membros, migrations.RunPython.noop),
+    ]
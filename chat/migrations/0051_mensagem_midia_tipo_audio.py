@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:20
+
+import mimetypes
+
+from django.db import migrations
+
+
+def marcar_audios(apps, schema_editor):
+    # Áudio enviado como arquivo ficou como "outro" antes do tipo "audio" existir
+    Mensagem = apps.get_model('chat', 'Mensagem')
+
+    lote = []
+    for msg in Mensagem.objects.filter(midia_tipo='outro').only('id', 'midia').iterator():
+        content_type = mimetypes.guess_type(msg.midia.name)[0] or ''
+        if not content_type.startswith('audio'):
+            continue
+        msg.midia_tipo = 'audio'
+        lote.append(msg)
+        if len(lote) >= 500:
+            Mensagem.objects.bulk_update(lote, ['midia_tipo'])
+            lote = []
+    if lote:
+        Mensagem.objects.bulk_update(lote, ['midia_tipo'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0050_clube_membros_contador'),
+    ]
+
+    operations = [
+        migrations.RunPython(marcar_audios, migrations.RunPython.noop),
+    ]
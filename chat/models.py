@@ -13,11 +13,22 @@ class ChatRoom(models.Model):
     user1 = models.CharField(max_length=100)
     user2 = models.CharField(max_length=100)
 
-from django.db import models
+import mimetypes
+import os
+import unicodedata
+
+from django.core.cache import cache
+from django.core.files.images import get_image_dimensions
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import m2m_changed
 from django.utils import timezone
 from datetime import timedelta, date
 import uuid
 
+# Tempo que a lista de bloqueios de um usuário fica em cache
+BLOQUEIOS_CACHE_TTL = 60 * 60
+
 class Clube(models.Model):
     nome = models.CharField(max_length=100)
     imagem = models.URLField()
@@ -31,16 +42,60 @@ class Clube(models.Model):
     dono = models.CharField(max_length=100)
     mods = models.TextField(blank=True)
     descricao = models.TextField()
-    membros = models.IntegerField(default=1)
+    # Contador mantido por adicionar_membro/remover_membro; não alterar direto
+    membros = models.IntegerField(default=0)
 
     def __str__(self):
         return self.nome
 
+    def tem_membro(self, usuario):
+        """Consulta pelo índice único (usuario, clube) da tabela de membros."""
+        if not usuario:
+            return False
+        return Usuario.clubes.through.objects.filter(clube_id=self.id, usuario_id=usuario.id).exists()
+
+    def adicionar_membro(self, usuario):
+        """Põe o usuário no clube e soma 1 em membros. False se já era membro."""
+        with transaction.atomic():
+            _, criado = Usuario.clubes.through.objects.get_or_create(clube_id=self.id, usuario_id=usuario.id)
+            if criado:
+                Clube.objects.filter(pk=self.pk).update(membros=F('membros') + 1)
+        if criado:
+            self._avisar_membros(usuario, 'post_add')
+        return criado
+
+    def remover_membro(self, usuario):
+        """Tira o usuário do clube e desconta de membros. False se não era membro."""
+        with transaction.atomic():
+            removidos, _ = Usuario.clubes.through.objects.filter(clube_id=self.id, usuario_id=usuario.id).delete()
+            if removidos:
+                Clube.objects.filter(pk=self.pk).update(membros=F('membros') - removidos)
+        if removidos:
+            self._avisar_membros(usuario, 'post_remove')
+        return bool(removidos)
+
+    def _avisar_membros(self, usuario, action):
+        # Gravando direto na tabela de membros o Django não dispara sinal
+        # nenhum; avisa os ouvintes de m2m_changed como usuario.clubes faria.
+        m2m_changed.send(
+            sender=Usuario.clubes.through, instance=usuario, action=action,
+            reverse=False, model=Clube, pk_set={self.pk}, using=self._state.db,
+        )
+
+def normalizar_nome(nome):
+    """Nome sem acentos e em minúsculas, usado na busca e na ordem do diretório."""
+    sem_acento = unicodedata.normalize('NFKD', nome or '')
+    sem_acento = ''.join(c for c in sem_acento if not unicodedata.combining(c))
+    return ' '.join(sem_acento.casefold().split())
+
+
 class Usuario(models.Model):
     nome = models.CharField(max_length=150)
+    # normalizar_nome(nome), mantido no save(); chave do diretório de usuários
+    nome_busca = models.CharField(max_length=150, blank=True, editable=False)
     email = models.EmailField(unique=True)
     senha = models.CharField(max_length=128)
-    session_key = models.CharField(max_length=100, blank=True, null=True) 
+    session_key = models.CharField(max_length=100, blank=True, null=True, db_index=True) 
 
     # Verificação
     token_verificacao = models.CharField(max_length=36, blank=True, null=True)
@@ -89,18 +144,104 @@ class Usuario(models.Model):
         blank=True
     )
 
+    @staticmethod
+    def _bloqueios_chave(usuario_id):
+        return f"usuario:{usuario_id}:bloqueios"
+
+    def _bloqueios(self):
+        """(ids que ele bloqueou, ids que o bloquearam), numa só consulta.
+
+        Fica em cache (compartilhado) e na própria instância; qualquer mudança
+        em bloqueados invalida os dois lados (ver bloqueios_mudaram).
+        """
+        bloqueios = getattr(self, '_bloqueios_cache', None)
+        if bloqueios is None:
+            chave = self._bloqueios_chave(self.id)
+            bloqueios = cache.get(chave)
+            if bloqueios is None:
+                bloqueados, bloqueado_por = set(), set()
+                pares = Usuario.bloqueados.through.objects.filter(
+                    Q(from_usuario_id=self.id) | Q(to_usuario_id=self.id)
+                ).values_list('from_usuario_id', 'to_usuario_id')
+                for de, para in pares:
+                    if de == self.id:
+                        bloqueados.add(para)
+                    if para == self.id:
+                        bloqueado_por.add(de)
+                bloqueios = (bloqueados, bloqueado_por)
+                cache.set(chave, bloqueios, BLOQUEIOS_CACHE_TTL)
+            self._bloqueios_cache = bloqueios
+        return bloqueios
+
+    @classmethod
+    def invalidar_bloqueios(cls, *usuario_ids):
+        from .feed import FEED_PERFIS_KEY
+
+        # Os perfis recomendados na home também filtram bloqueios
+        cache.delete_many(
+            [cls._bloqueios_chave(uid) for uid in usuario_ids]
+            + [FEED_PERFIS_KEY.format(uid) for uid in usuario_ids]
+        )
+
+    def ids_bloqueados(self):
+        return self._bloqueios()[0]
+
+    def ids_bloqueado_por(self):
+        return self._bloqueios()[1]
+
     def bloquear(self, outro_usuario):
         self.bloqueados.add(outro_usuario)
+        outro_usuario._bloqueios_cache = None
 
     def desbloquear(self, outro_usuario):
         self.bloqueados.remove(outro_usuario)
+        outro_usuario._bloqueios_cache = None
 
     def esta_bloqueado(self, outro_usuario):
-        return outro_usuario in self.bloqueados.all()
+        return outro_usuario.id in self.ids_bloqueados()
+
+    def foi_bloqueado_por(self, outro_usuario):
+        return outro_usuario.id in self.ids_bloqueado_por()
+
+    def filtrar_bloqueios(self, usuario_ids):
+        """Quais desses ids têm bloqueio com ele, em qualquer direção."""
+        bloqueados, bloqueado_por = self._bloqueios()
+        return {uid for uid in usuario_ids if uid in bloqueados or uid in bloqueado_por}
+
+    class Meta:
+        indexes = [
+            # Paginação do diretório por (nome_busca, id) e busca por prefixo
+            models.Index(fields=['nome_busca', 'id'], name='usuario_diretorio_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.nome_busca = normalizar_nome(self.nome)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nome' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'nome_busca'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.nome
 
+
+def bloqueios_mudaram(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Usuario.bloqueados, dos dois lados e por qualquer caminho (add, remove, clear)."""
+    if action == 'pre_clear':
+        # Depois do clear não dá mais para saber quem estava do outro lado
+        de, para = ('to_usuario_id', 'from_usuario_id') if reverse else ('from_usuario_id', 'to_usuario_id')
+        instance._bloqueios_limpos = set(
+            sender.objects.filter(**{de: instance.pk}).values_list(para, flat=True)
+        )
+        return
+    if not action.startswith('post_'):
+        return
+    ids = set(pk_set or ()) | getattr(instance, '_bloqueios_limpos', set())
+    ids.add(instance.pk)
+    instance._bloqueios_limpos = set()
+    instance._bloqueios_cache = None
+    Usuario.invalidar_bloqueios(*ids)
+
 import uuid
 from django.db import models
 
@@ -134,6 +275,13 @@ class Conversation(models.Model):
         conv, _ = cls.objects.get_or_create(user1=u1, user2=u2)
         return conv
 
+    def marcar_lida(self, usuario, ate_id=None):
+        """Marca a conversa como lida até ate_id (por padrão, até a última mensagem)."""
+        if ate_id is None:
+            ate_id = self.mensagens.aggregate(ultimo=models.Max('id'))['ultimo']
+        if ate_id:
+            ConversaParticipante.marcar_lida(self.id, usuario.id, ate_id)
+
 
 
 # chat/models.py
@@ -169,11 +317,163 @@ class Mensagem(models.Model):
         blank=True,
         null=True
     )
+    # Metadados da mídia, calculados uma vez no upload (ver preencher_metadados_midia)
+    midia_tipo = models.CharField(max_length=20, blank=True)
+    midia_nome = models.CharField(max_length=255, blank=True)
+    midia_tamanho = models.PositiveBigIntegerField(null=True, blank=True)
+    midia_largura = models.PositiveIntegerField(null=True, blank=True)
+    midia_altura = models.PositiveIntegerField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Cursor do conversation_messages_json (?after= / ?before=)
+            models.Index(fields=['conversation', 'id'], name='mensagem_conversa_id_idx'),
+        ]
+
     def __str__(self):
         return f"[{self.timestamp:%Y-%m-%d %H:%M}] {self.remetente.nome} → {self.destinatario.nome}"
 
+    @staticmethod
+    def tipo_midia(content_type):
+        if not content_type:
+            return ''
+        if content_type.startswith('image'):
+            return 'imagem'
+        if content_type.startswith('video'):
+            return 'video'
+        if content_type.startswith('audio'):
+            return 'audio'
+        if content_type.startswith('application'):
+            return 'documento'
+        return 'outro'
+
+    def preencher_metadados_midia(self):
+        """Tipo, nome, tamanho e (imagens) dimensões da mídia, a partir do upload."""
+        if not self.midia:
+            self.midia_tipo = self.midia_nome = ''
+            self.midia_tamanho = self.midia_largura = self.midia_altura = None
+            return
+
+        content_type = None
+        if not self.midia._committed:
+            # Arquivo recém-enviado: o navegador já informou o tipo
+            content_type = getattr(self.midia.file, 'content_type', None)
+        content_type = content_type or mimetypes.guess_type(self.midia.name)[0]
+
+        self.midia_tipo = self.tipo_midia(content_type)
+        self.midia_nome = os.path.basename(self.midia.name)
+        self.midia_tamanho = self.midia.size
+        self.midia_largura = self.midia_altura = None
+        if self.midia_tipo == 'imagem':
+            # Só lê o cabeçalho da imagem
+            self.midia_largura, self.midia_altura = get_image_dimensions(self.midia)
+
+    def save(self, *args, **kwargs):
+        if self.midia and not self.midia._committed:
+            self.preencher_metadados_midia()
+        super().save(*args, **kwargs)
+
+
+
+class ConversaParticipante(models.Model):
+    """Uma conversa vista por um dos participantes: a linha da caixa de entrada.
+
+    lido_ate é a marca d'água de leitura (toda mensagem com id <= lido_ate já
+    foi vista), o que substitui o visto_por por mensagem. Os demais campos
+    são um resumo mantido a cada envio e leitura, para listar a caixa de
+    entrada sem tocar nas mensagens.
+    """
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='participantes'
+    )
+    usuario = models.ForeignKey(
+        'Usuario',
+        on_delete=models.CASCADE,
+        related_name='participacoes'
+    )
+    amigo = models.ForeignKey(
+        'Usuario',
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True
+    )
+    lido_ate = models.BigIntegerField(default=0)
+
+    # Resumo da caixa de entrada
+    ultima_mensagem = models.ForeignKey(
+        'Mensagem',
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True, blank=True
+    )
+    preview = models.CharField(max_length=100, blank=True)
+    atualizado_em = models.DateTimeField(null=True, blank=True)
+    nao_lidas = models.PositiveIntegerField(default=0)
+
+    PREVIEW_MIDIA = "(mídia ou áudio)"
+
+    class Meta:
+        unique_together = (('conversation', 'usuario'),)
+        indexes = [
+            models.Index(fields=['usuario', '-atualizado_em'], name='caixa_entrada_idx'),
+        ]
+
+    @classmethod
+    def marcar_lida(cls, conversation_id, usuario_id, ate_id):
+        """Avança a marca de leitura até ate_id e retorna a marca gravada.
+
+        ate_id vem do cliente; passa da última mensagem da conversa, fica nela.
+        """
+        ultimo = Mensagem.objects.filter(
+            conversation_id=conversation_id
+        ).aggregate(ultimo=models.Max('id'))['ultimo'] or 0
+        ate_id = min(ate_id, ultimo)
+        if ate_id <= 0:
+            return 0
+        # A marca só avança; normalmente é um UPDATE e uma contagem pelo índice
+        pendentes = Mensagem.objects.filter(
+            conversation_id=conversation_id, id__gt=ate_id
+        ).exclude(remetente_id=usuario_id).count()
+        atualizadas = cls.objects.filter(
+            conversation_id=conversation_id, usuario_id=usuario_id, lido_ate__lt=ate_id
+        ).update(lido_ate=ate_id, nao_lidas=pendentes)
+        if not atualizadas:
+            cls.objects.get_or_create(
+                conversation_id=conversation_id, usuario_id=usuario_id,
+                defaults={'lido_ate': ate_id, 'nao_lidas': pendentes}
+            )
+        return ate_id
+
+    @classmethod
+    def registrar_mensagem(cls, msg):
+        """Atualiza a caixa de entrada dos dois lados com a mensagem nova."""
+        resumo = {
+            'ultima_mensagem_id': msg.id,
+            'preview': (msg.conteudo or cls.PREVIEW_MIDIA)[:100],
+            'atualizado_em': msg.timestamp,
+        }
+        lados = (
+            # Quem envia leu a conversa até aqui
+            (msg.remetente_id, msg.destinatario_id, {'lido_ate': msg.id, 'nao_lidas': 0}),
+            (msg.destinatario_id, msg.remetente_id, {'nao_lidas': models.F('nao_lidas') + 1}),
+        )
+        for usuario_id, amigo_id, campos in lados:
+            atualizadas = cls.objects.filter(
+                conversation_id=msg.conversation_id, usuario_id=usuario_id
+            ).update(amigo_id=amigo_id, **resumo, **campos)
+            if not atualizadas:
+                inicial = {'nao_lidas': 1} if usuario_id == msg.destinatario_id else campos
+                cls.objects.get_or_create(
+                    conversation_id=msg.conversation_id, usuario_id=usuario_id,
+                    defaults=dict(amigo_id=amigo_id, **resumo, **inicial)
+                )
+
+    def __str__(self):
+        return f"{self.usuario} leu {self.conversation_id} até {self.lido_ate}"
+
 
 
 # chat/models.py
@@ -188,6 +488,12 @@ class Recado(models.Model):
     top = models.IntegerField(default=0)
     z_index = models.IntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            # Mural paginado por (data, id), do mais novo para o mais antigo
+            models.Index(fields=['perfil', 'data', 'id'], name='recado_mural_idx'),
+        ]
+
     def __str__(self):
         return f"Recado de {self.autor} para {self.perfil.nome}"
 
@@ -236,6 +542,12 @@ class SalaMensagem(models.Model):
     texto = models.TextField()
     criado_em = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Janela "últimas N da sala" e paginação por (criado_em, id)
+            models.Index(fields=['sala', 'criado_em', 'id'], name='salamensagem_janela_idx'),
+        ]
+
     def __str__(self):
         return f"{self.autor}: {self.texto[:30]}"
 
@@ -307,3 +619,45 @@ class WPlaceState(models.Model):
     offset_y = models.FloatField(default=0)
     zoom = models.FloatField(default=1)
     updated_at = models.DateTimeField(auto_now=True)
+
+
+class MidiaVariante(models.Model):
+    """Versão derivada de um arquivo enviado (miniatura, WebP, áudio normalizado).
+
+    Ligada ao original pelo nome no storage, então serve para qualquer
+    FileField (Mensagem, Topico, Evento, Post) e um arquivo substituído ganha
+    variantes novas. Gerada em segundo plano por chat/midia_pipeline.py.
+    """
+    THUMB = 'thumb'
+    WEBP = 'webp'
+    AUDIO = 'audio'
+    TIPOS = [
+        (THUMB, 'Miniatura'),
+        (WEBP, 'Imagem WebP'),
+        (AUDIO, 'Áudio normalizado'),
+    ]
+
+    original = models.CharField(max_length=255, db_index=True)
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    arquivo = models.FileField(upload_to='variantes/')
+    largura = models.PositiveIntegerField(null=True, blank=True)
+    altura = models.PositiveIntegerField(null=True, blank=True)
+    tamanho = models.PositiveIntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('original', 'tipo')
+
+    def __str__(self):
+        return f"{self.original} [{self.tipo}]"
+
+    @classmethod
+    def urls_para(cls, nomes):
+        """{nome original: {tipo: url}} para vários arquivos numa consulta só."""
+        nomes = {n for n in nomes if n}
+        resultado = {}
+        if not nomes:
+            return resultado
+        for v in cls.objects.filter(original__in=nomes):
+            resultado.setdefault(v.original, {})[v.tipo] = v.arquivo.url
+        return resultado
@@ -0,0 +1,94 @@
+"""Retrato em cache do perfil público (perfil_usuario).
+
+O que é igual para qualquer visitante (campos do perfil, amigos, clubes e a
+primeira página do mural) fica num item de cache por usuário. Os sinais
+apagam o item quando o usuário é salvo, quando um recado do mural muda e
+quando amizades ou clubes mudam (ver chat/signals.py); o TTL cobre o resto.
+O que depende de quem visita (amizade, bloqueio) fica fora do retrato e é
+respondido na view.
+"""
+from datetime import date
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Recado, Usuario
+
+PERFIL_CACHE_TTL = 10 * 60
+PERFIL_AMIGOS = 12
+
+# Mural de recados: tamanho da página e teto do ?limit=
+RECADOS_POR_PAGINA = 30
+RECADOS_LIMITE_MAX = 100
+
+
+def pagina_recados(perfil, cursor='', limit=RECADOS_POR_PAGINA):
+    """Página do mural por keyset em (data, id), dos mais novos para os mais antigos.
+
+    cursor é o "proximo" devolvido pela página anterior. Retorna (recados, proximo).
+    """
+    recados = Recado.objects.filter(perfil=perfil)
+    if cursor:
+        cursor_id, _, cursor_data = cursor.partition(':')
+        cursor_data = date.fromisoformat(cursor_data)
+        recados = recados.filter(
+            Q(data__lt=cursor_data) | Q(data=cursor_data, id__lt=int(cursor_id))
+        )
+
+    pagina = list(recados.order_by('-data', '-id')[:limit + 1])
+    proximo = None
+    if len(pagina) > limit:
+        pagina = pagina[:limit]
+        proximo = f"{pagina[-1].id}:{pagina[-1].data.isoformat()}"
+    return pagina, proximo
+
+
+def _chave(usuario_id):
+    return f'perfil:{usuario_id}'
+
+
+def retrato_perfil(usuario_id):
+    """Dados do perfil que não dependem de quem visita, ou None se não existir."""
+    chave = _chave(usuario_id)
+    retrato = cache.get(chave)
+    if retrato is None:
+        usuario = Usuario.objects.filter(id=usuario_id).first()
+        if usuario is None:
+            return None
+        recados, proximo = pagina_recados(usuario)
+        retrato = {
+            'usuario': usuario,
+            'total_amigos': usuario.amigos.count(),
+            'amigos': list(
+                usuario.amigos.only('id', 'nome', 'foto', 'descricao')
+                .order_by('nome_busca', 'id')[:PERFIL_AMIGOS]
+            ),
+            'clubes': list(usuario.clubes.order_by('nome')),
+            'recados': recados,
+            'proximo_recados': proximo,
+        }
+        cache.set(chave, retrato, PERFIL_CACHE_TTL)
+    return retrato
+
+
+def invalidar_perfil(*usuario_ids):
+    if usuario_ids:
+        cache.delete_many([_chave(uid) for uid in usuario_ids])
+
+
+def usuario_salvo(sender, instance, **kwargs):
+    invalidar_perfil(instance.pk)
+
+
+def recado_mudou(sender, instance, **kwargs):
+    invalidar_perfil(instance.perfil_id)
+
+
+def relacao_mudou(sender, instance, action, model, pk_set, **kwargs):
+    """Usuario.amigos e Usuario.clubes, dos dois lados da relação."""
+    if not action.startswith('post_'):
+        return
+    ids = set(pk_set or ()) if model is Usuario else set()
+    if isinstance(instance, Usuario):
+        ids.add(instance.pk)
+    invalidar_perfil(*ids)
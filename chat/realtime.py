@@ -0,0 +1,22 @@
+# chat/realtime.py
+# Publicação de eventos nos grupos do channel layer a partir de código síncrono
+# (views). Os consumers que escutam esses grupos ficam em consumers.py.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+
+def conversa_group(conv_id):
+    return f"conversa_{conv_id}"
+
+
+def sala_group(sala_id):
+    return f"sala_{sala_id}"
+
+
+def publicar(group, evento):
+    """Envia o evento ao grupo depois do commit, para quem recebe já achar a linha no banco."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    transaction.on_commit(lambda: async_to_sync(channel_layer.group_send)(group, evento))
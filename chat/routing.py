@@ -4,4 +4,7 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<room_id>\w{8})/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'ws/match/$', consumers.MatchConsumer.as_asgi()),
+    re_path(r'ws/conversation/(?P<conv_id>[0-9a-f-]{36})/$', consumers.ConversationConsumer.as_asgi()),
+    re_path(r'ws/sala/(?P<sala_id>\d+)/$', consumers.SalaConsumer.as_asgi()),
 ]
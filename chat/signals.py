@@ -0,0 +1,39 @@
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .feed import indexar_gostos, invalidar_feed
+from .midia_pipeline import CAMPOS_AUDIO, CAMPOS_MIDIA, agendar
+from .models import Recado, Usuario, bloqueios_mudaram
+from .perfis import recado_mudou, relacao_mudou, usuario_salvo
+
+# Models que compõem as seções globais do feed da home
+MODELS_FEED = ("chat.Novidade", "chat.Tema", "chat.Clube")
+
+
+def midia_salva(sender, instance, update_fields=None, **kwargs):
+    label = sender._meta.label
+    for campo in CAMPOS_MIDIA[label]:
+        if update_fields is not None and campo not in update_fields:
+            continue
+        arquivo = getattr(instance, campo)
+        if arquivo:
+            agendar(arquivo.name, audio=(label, campo) in CAMPOS_AUDIO)
+
+
+def conectar():
+    for label in CAMPOS_MIDIA:
+        post_save.connect(midia_salva, sender=apps.get_model(label), dispatch_uid=f"midia_{label}")
+    for label in MODELS_FEED:
+        for sinal in (post_save, post_delete):
+            sinal.connect(invalidar_feed, sender=apps.get_model(label), dispatch_uid=f"feed_{label}")
+
+    post_save.connect(indexar_gostos, sender=Usuario, dispatch_uid="feed_gostos_usuario")
+    # Cache de bloqueios (Usuario._bloqueios) e perfis recomendados
+    m2m_changed.connect(bloqueios_mudaram, sender=Usuario.bloqueados.through, dispatch_uid="bloqueios_usuario")
+
+    # Retrato do perfil público (chat/perfis.py)
+    post_save.connect(usuario_salvo, sender=Usuario, dispatch_uid="perfil_usuario")
+    for sinal in (post_save, post_delete):
+        sinal.connect(recado_mudou, sender=Recado, dispatch_uid="perfil_recado")
+    for relacao in (Usuario.amigos.through, Usuario.clubes.through):
+        m2m_changed.connect(relacao_mudou, sender=relacao, dispatch_uid=f"perfil_{relacao._meta.label}")
@@ -1,3 +1,326 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .avatares import AvatarError, caminho_avatar, salvar_avatar
+from .matching import InMemoryMatchmaker, find_partner
+from .models import (
+    ChatRoom,
+    Clube,
+    ConversaParticipante,
+    Conversation,
+    Mensagem,
+    Recado,
+    Usuario,
+)
+from .views import criar_mensagem_conversa
+
+# Sem Redis nos testes
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+CAMADA_MEMORIA = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def entrada(usuario_id, gostos=(), temp_interests=()):
+    return {
+        'usuario_id': usuario_id,
+        'gostos': list(gostos),
+        'temp_interests': list(temp_interests),
+        'localizacao': '',
+    }
+
+
+class InMemoryMatchmakerTests(TestCase):
+    def setUp(self):
+        self.mm = InMemoryMatchmaker()
+
+    def sessoes(self, candidatos):
+        return {c['session_key'] for c in candidatos}
+
+    def test_rejoin_mantem_joined_at_e_troca_tags(self):
+        self.mm.join('a', entrada(1, gostos=['jazz']))
+        joined_at = self.mm.waiting()[0]['joined_at']
+
+        self.mm.join('a', entrada(1, gostos=['rock']))
+
+        espera = self.mm.waiting()
+        self.assertEqual(len(espera), 1)
+        self.assertEqual(espera[0]['joined_at'], joined_at)
+        self.assertEqual(self.sessoes(self.mm.candidates(['g:jazz'])), set())
+        self.assertEqual(self.sessoes(self.mm.candidates(['g:rock'])), {'a'})
+
+    def test_pair_falha_se_um_dos_dois_saiu(self):
+        self.mm.join('a', entrada(1))
+        self.mm.join('b', entrada(2))
+        self.mm.leave('b')
+
+        self.assertFalse(self.mm.pair('a', 'b', 'sala0001'))
+        self.assertFalse(self.mm.pair('b', 'a', 'sala0001'))
+        self.assertIsNone(self.mm.room_for('a'))
+        self.assertEqual(self.sessoes(self.mm.waiting()), {'a'})
+
+    def test_ninguem_e_pareado_duas_vezes(self):
+        for sessao, uid in (('a', 1), ('b', 2), ('c', 3)):
+            self.mm.join(sessao, entrada(uid))
+
+        self.assertTrue(self.mm.pair('a', 'b', 'sala0001'))
+        self.assertFalse(self.mm.pair('a', 'c', 'sala0002'))
+        self.assertFalse(self.mm.pair('c', 'b', 'sala0002'))
+        self.assertEqual(self.mm.room_for('a'), 'sala0001')
+        self.assertEqual(self.mm.room_for('b'), 'sala0001')
+        # Em sala, join não volta para a fila
+        self.assertFalse(self.mm.join('a', entrada(1)))
+        self.assertEqual(self.sessoes(self.mm.waiting()), {'c'})
+
+    def test_candidates_so_quem_compartilha_tag(self):
+        self.mm.join('a', entrada(1, gostos=['jazz', 'café']))
+        self.mm.join('b', entrada(2, gostos=['rock']))
+        self.mm.join('c', entrada(3, temp_interests=['xadrez']))
+        self.mm.join('d', entrada(4, gostos=['café']))
+
+        self.assertEqual(self.sessoes(self.mm.candidates(['g:café'])), {'a', 'd'})
+        self.assertEqual(self.sessoes(self.mm.candidates(['g:rock'])), {'b'})
+        self.assertEqual(self.sessoes(self.mm.candidates(['t:xadrez'])), {'c'})
+        self.assertEqual(self.sessoes(self.mm.candidates(['g:samba'])), set())
+
+    def test_leave_limpa_o_indice(self):
+        self.mm.join('a', entrada(1, gostos=['jazz']))
+        self.mm.leave('a')
+
+        self.assertEqual(self.mm.candidates(['g:jazz']), [])
+        self.assertEqual(self.mm._index, {})
+
+
+@override_settings(
+    CACHES=LOCMEM,
+    CHANNEL_LAYERS=CAMADA_MEMORIA,
+    MATCHMAKING={'SCHEDULER': {'ENABLED': False}},
+)
+class FindPartnerTests(TestCase):
+    def setUp(self):
+        self.mm = InMemoryMatchmaker()
+        patcher = mock.patch('chat.matching.get_matchmaker', return_value=self.mm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def usuario(self, nome):
+        return Usuario.objects.create(
+            nome=nome, email=f'{nome}@example.com', session_key=f'sessao-{nome}'
+        )
+
+    def test_pula_parceiro_bloqueado(self):
+        ana, bia, caio = self.usuario('ana'), self.usuario('bia'), self.usuario('caio')
+        ana.bloquear(bia)
+
+        self.assertIsNone(find_partner(bia.session_key, bia, []))
+        self.assertIsNone(find_partner(ana.session_key, ana, []))
+        self.assertEqual(ChatRoom.objects.count(), 0)
+
+        # Quem não tem bloqueio pareia com o primeiro da fila
+        room_id = find_partner(caio.session_key, caio, [])
+        self.assertIsNotNone(room_id)
+        self.assertEqual(self.mm.room_for(bia.session_key), room_id)
+        self.assertIsNone(self.mm.room_for(ana.session_key))
+
+
+def criar_usuario(nome):
+    return Usuario.objects.create(nome=nome, email=f'{nome}@example.com')
+
+
+def logar(usuario, **kwargs):
+    client = Client(**kwargs)
+    sessao = client.session
+    sessao['usuario_id'] = usuario.id
+    sessao.save()
+    return client
+
+
+@override_settings(CACHES=LOCMEM)
+class ClubeMembrosTests(TestCase):
+    def setUp(self):
+        self.clube = Clube.objects.create(
+            nome='Café', imagem='https://example.com/c.png', tipo='Pública', dono='ana', descricao='.'
+        )
+        self.ana = criar_usuario('ana')
+
+    def test_contador_acompanha_entrada_e_saida(self):
+        self.assertTrue(self.clube.adicionar_membro(self.ana))
+        self.assertFalse(self.clube.adicionar_membro(self.ana))
+        self.clube.refresh_from_db()
+        self.assertEqual(self.clube.membros, 1)
+        self.assertTrue(self.clube.tem_membro(self.ana))
+
+        self.assertTrue(self.clube.remover_membro(self.ana))
+        self.assertFalse(self.clube.remover_membro(self.ana))
+        self.clube.refresh_from_db()
+        self.assertEqual(self.clube.membros, 0)
+        self.assertFalse(self.clube.tem_membro(self.ana))
+
+
+@override_settings(CACHES=LOCMEM, CHANNEL_LAYERS=CAMADA_MEMORIA)
+class ConversaTests(TestCase):
+    def setUp(self):
+        self.ana, self.bia = criar_usuario('ana'), criar_usuario('bia')
+        self.conv = Conversation.get_or_create_conversation(self.ana, self.bia)
+        self.msgs = [
+            criar_mensagem_conversa(self.conv, self.ana, self.bia, f'oi {i}') for i in range(5)
+        ]
+
+    def participante(self, usuario):
+        return ConversaParticipante.objects.get(conversation=self.conv, usuario=usuario)
+
+    def url(self, **params):
+        query = '&'.join(f'{k}={v}' for k, v in params.items())
+        return reverse('chat:conversation_messages_json', args=[self.conv.id]) + (f'?{query}' if query else '')
+
+    def test_caixa_de_entrada_conta_e_marca_lidas(self):
+        self.assertEqual(self.participante(self.bia).nao_lidas, 5)
+        self.assertEqual(self.participante(self.ana).nao_lidas, 0)
+
+        ConversaParticipante.marcar_lida(self.conv.id, self.bia.id, self.msgs[2].id)
+        bia = self.participante(self.bia)
+        self.assertEqual((bia.lido_ate, bia.nao_lidas), (self.msgs[2].id, 2))
+
+        # A marca não volta
+        ConversaParticipante.marcar_lida(self.conv.id, self.bia.id, self.msgs[0].id)
+        self.assertEqual(self.participante(self.bia).lido_ate, self.msgs[2].id)
+
+    def test_marcar_lida_nao_passa_da_ultima_mensagem(self):
+        marca = ConversaParticipante.marcar_lida(self.conv.id, self.bia.id, 10 ** 12)
+        self.assertEqual(marca, self.msgs[-1].id)
+        bia = self.participante(self.bia)
+        self.assertEqual((bia.lido_ate, bia.nao_lidas), (self.msgs[-1].id, 0))
+
+    def test_paginas_por_cursor(self):
+        client = logar(self.ana)
+        ids = [m.id for m in self.msgs]
+
+        recentes = client.get(self.url(limit=2)).json()
+        self.assertEqual([m['id'] for m in recentes['mensagens']], ids[-2:])
+        self.assertTrue(recentes['tem_mais'])
+
+        anteriores = client.get(self.url(before=ids[-2], limit=2)).json()
+        self.assertEqual([m['id'] for m in anteriores['mensagens']], ids[1:3])
+
+        novas = client.get(self.url(after=ids[1], limit=10)).json()
+        self.assertEqual([m['id'] for m in novas['mensagens']], ids[2:])
+        self.assertFalse(novas['tem_mais'])
+
+        self.assertEqual(client.get(self.url(after=ids[0], before=ids[-1])).status_code, 400)
+
+    def test_etag_devolve_304_ate_chegar_mensagem(self):
+        client = logar(self.ana)
+        url = self.url(after=self.msgs[-1].id)
+        etag = client.get(url)['ETag']
+
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        criar_mensagem_conversa(self.conv, self.bia, self.ana, 'voltei')
+        resposta = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([m['conteudo'] for m in resposta.json()['mensagens']], ['voltei'])
+
+    def test_quem_nao_participa_nao_le(self):
+        self.assertEqual(logar(criar_usuario('caio')).get(self.url()).status_code, 403)
+
+
+@override_settings(CACHES=LOCMEM)
+class LayoutRecadosTests(TestCase):
+    def setUp(self):
+        self.dono, self.visita = criar_usuario('dono'), criar_usuario('visita')
+        self.da_visita = Recado.objects.create(perfil=self.dono, autor='visita', texto='oi')
+        self.de_outro = Recado.objects.create(perfil=self.dono, autor='outro', texto='olá')
+        self.outro_mural = Recado.objects.create(perfil=self.visita, autor='visita', texto='eu')
+
+    def mover(self, client, perfil_id):
+        corpo = {'perfil': perfil_id, 'recados': [
+            {'id': r.id, 'left': 40, 'top': 50}
+            for r in (self.da_visita, self.de_outro, self.outro_mural)
+        ]}
+        return client.post(reverse('chat:layout_recados'), json.dumps(corpo), content_type='application/json')
+
+    def lefts(self):
+        return [
+            Recado.objects.get(pk=r.pk).left
+            for r in (self.da_visita, self.de_outro, self.outro_mural)
+        ]
+
+    def test_exige_login_e_csrf(self):
+        self.assertEqual(self.mover(Client(), self.dono.id).status_code, 401)
+        self.assertEqual(self.mover(logar(self.dono, enforce_csrf_checks=True), self.dono.id).status_code, 403)
+        self.assertEqual(self.lefts(), [0, 0, 0])
+
+    def test_visita_so_move_os_proprios_recados_do_mural(self):
+        resposta = self.mover(logar(self.visita), self.dono.id)
+        self.assertEqual(resposta.json()['atualizados'], 1)
+        self.assertEqual(self.lefts(), [40, 0, 0])
+
+    def test_dono_move_qualquer_recado_do_proprio_mural(self):
+        resposta = self.mover(logar(self.dono), self.dono.id)
+        self.assertEqual(resposta.json()['atualizados'], 2)
+        self.assertEqual(self.lefts(), [40, 40, 0])
+
+
+class MidiaTestCase(TestCase):
+    """Arquivos gravados numa pasta temporária, apagada no fim."""
+
+    def setUp(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=pasta)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+
+@override_settings(
+    CACHES=LOCMEM,
+    CHANNEL_LAYERS=CAMADA_MEMORIA,
+    UPLOAD_LIMITS={'image/': 1024},
+)
+class LimiteUploadTests(MidiaTestCase):
+    def test_arquivo_acima_do_limite_volta_413(self):
+        ana, bia = criar_usuario('ana'), criar_usuario('bia')
+        conv = Conversation.get_or_create_conversation(ana, bia)
+        url = reverse('chat:send_conversation_message', args=[conv.id])
+        client = logar(ana)
+
+        grande = SimpleUploadedFile('foto.png', b'x' * 2048, content_type='image/png')
+        self.assertEqual(client.post(url, {'midia': grande}).status_code, 413)
+        self.assertFalse(Mensagem.objects.exists())
+
+        # O limite é por tipo: o mesmo tamanho como documento passa
+        documento = SimpleUploadedFile('nota.pdf', b'x' * 2048, content_type='application/pdf')
+        self.assertEqual(client.post(url, {'midia': documento}).status_code, 200)
+        self.assertEqual(Mensagem.objects.get().midia_tipo, 'documento')
+
+
+class AvatarTests(MidiaTestCase):
+    def data_url(self, tamanho=(600, 400)):
+        buf = io.BytesIO()
+        Image.new('RGB', tamanho, 'red').save(buf, 'PNG')
+        return 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode()
+
+    def test_data_url_vira_webp_reduzido(self):
+        url = salvar_avatar(self.data_url())
+
+        digest = url.rsplit('/', 1)[1].removesuffix('.webp')
+        for mini, lado in ((False, 256), (True, 64)):
+            with default_storage.open(caminho_avatar(digest, mini=mini)) as f:
+                img = Image.open(f)
+                self.assertEqual((img.format, max(img.size)), ('WEBP', lado))
+
+        # A mesma imagem reaproveita os arquivos
+        self.assertEqual(salvar_avatar(self.data_url()), url)
+
+    def test_url_comum_passa_e_data_url_quebrado_falha(self):
+        self.assertEqual(salvar_avatar('https://example.com/a.png'), 'https://example.com/a.png')
+        with self.assertRaises(AvatarError):
+            salvar_avatar('data:image/png;base64,@@@')
@@ -0,0 +1,58 @@
+"""Limite de tamanho por tipo de arquivo nos uploads multipart.
+
+``LimiteUploadHandler`` fica na frente dos handlers padrão do Django em
+``FILE_UPLOAD_HANDLERS``: conta os bytes de cada arquivo enquanto o corpo é
+lido e, passando do limite do tipo, descarta o arquivo (``SkipFile``) sem
+guardá-lo. As views consultam ``upload_excedido(request)`` e respondem 413.
+
+Os limites ficam em ``DEFAULT_UPLOAD_LIMITS`` (prefixo do content type ->
+bytes, com ``"*"`` para o resto); ``settings.UPLOAD_LIMITS``, se existir,
+sobrescreve só as entradas que trouxer.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+MB = 1024 * 1024
+
+DEFAULT_UPLOAD_LIMITS = {
+    "image/": 10 * MB,
+    "audio/": 25 * MB,
+    "video/": 100 * MB,
+    "*": 10 * MB,
+}
+
+
+def upload_limits():
+    return {**DEFAULT_UPLOAD_LIMITS, **getattr(settings, "UPLOAD_LIMITS", {})}
+
+
+def limite_upload(content_type):
+    limites = upload_limits()
+    for prefixo, limite in limites.items():
+        if prefixo != "*" and (content_type or "").startswith(prefixo):
+            return limite
+    return limites["*"]
+
+
+def upload_excedido(request):
+    """Nome do campo cujo arquivo passou do limite, ou None."""
+    # Força o parse do multipart, que é quando o handler roda
+    request.FILES
+    return getattr(request, "upload_excedido", None)
+
+
+class LimiteUploadHandler(FileUploadHandler):
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.limite = limite_upload(content_type)
+        self.recebido = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.recebido += len(raw_data)
+        if self.recebido > self.limite:
+            self.request.upload_excedido = self.field_name
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -3,9 +3,11 @@ from . import views
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('usuarios/diretorio/', views.diretorio_usuarios_json, name='diretorio_usuarios'),
     path('find_match/', views.find_match, name='find_match'),
     path('chat/', views.chat, name='chat'),
     path('chat/<str:room_id>/', views.chat_view, name='chat_view'),
+    path('chat/<str:room_id>/midia/', views.chat_media_upload, name='chat_media_upload'),
     path('leave/', views.leave_chat, name='leave_chat'),
     path('profile/', views.profile, name='profile'),  
     path('edit-profile-save', views.editar_perfil, name="editar_perfil"),
@@ -18,6 +20,8 @@ urlpatterns = [
     path('adicionar_amigo/<int:usuario_id>/', views.adicionar_amigo, name='adicionar_amigo'),
     path('usuario/<int:usuario_id>/', views.perfil_usuario, name='perfil_usuario'),
     path('usuario/<int:usuario_id>/recado/', views.enviar_recado, name='enviar_recado'),
+    path('usuario/<int:usuario_id>/recados/', views.recados_mural_json, name='recados_mural'),
+    path('usuario/<int:usuario_id>/conversa/', views.abrir_conversa, name='abrir_conversa'),
 
     path('conversation/<uuid:conv_id>/', views.conversation_view, name='conversation'),
     path('conversation/<uuid:conv_id>/send/', views.send_conversation_message, name='send_conversation_message'),
@@ -27,6 +31,7 @@ urlpatterns = [
       name='conversation_messages_json'
     ),
     path('recado/mover/<int:recado_id>/', views.mover_recado, name='mover_recado'),
+    path('recado/layout/', views.layout_recados, name='layout_recados'),
     path('excluir_recado/<int:recado_id>/', views.excluir_recado, name='excluir_recado'),
     path('excluir_recado_usuario/<int:recado_id>/', views.excluir_recado_usuario, name='excluir_recado_usuario'),
 
@@ -39,6 +44,7 @@ urlpatterns = [
     path('clubes/<int:clube_id>/solicitacao/<int:solicitacao_id>/aprovar/', views.clubes_aprovar_solicitacao, name='clubes_aprovar_solicitacao'),
     path('clubes/<int:clube_id>/solicitacao/<int:solicitacao_id>/rejeitar/', views.clubes_rejeitar_solicitacao, name='clubes_rejeitar_solicitacao'),
     path('clubes/<int:pk>/sair/', views.clubes_sair, name='clubes_sair'),
+    path('clubes/<int:pk>/membros/', views.clube_membros_json, name='clube_membros'),
 
     path('clubes/<int:clube_id>/nova_discussao/', views.clube_nova_discussao, name='clube_nova_discussao'), 
     path('clubes/<int:clube_id>/topico/<int:topico_id>/', views.clube_topico, name='clube_topico'),
@@ -47,6 +53,7 @@ urlpatterns = [
 
     path('salas/<int:sala_id>/', views.sala_detalhe, name='sala_detalhe'),
     path('salas/<int:sala_id>/enviar/', views.enviar_mensagem, name='enviar_mensagem'),
+    path('salas/<int:sala_id>/mensagens/', views.sala_mensagens_json, name='sala_mensagens_json'),
 
     path('notificacoes/', views.notificacoes, name='notificacoes'),
 
@@ -1,7 +1,5 @@
-import uuid
 import json
 import random
-import mimetypes
 from datetime import timedelta
 
 from django import forms
@@ -10,22 +8,34 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.core.mail import send_mail
-from django.db.models import Q, Max, Count
-from django.http import JsonResponse, HttpResponseForbidden
+from django.db.models import Q, Max
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.views.decorators.http import require_POST, require_http_methods
 from django.views.decorators.clickjacking import xframe_options_exempt
 
+from .avatares import AvatarError, salvar_avatar, url_mini
+from .feed import montar_feed
 from .forms import EventoForm
+from .matching import find_partner, get_matchmaker, parse_temp_interests
+from .midia_pipeline import anexar_variantes
+from .media import CHUNK_SIZE, MediaError, MediaGrandeDemais, media_url, salvar_midia
+from .middleware import usuario_da_request
+from .perfis import RECADOS_LIMITE_MAX, RECADOS_POR_PAGINA, invalidar_perfil, pagina_recados, retrato_perfil
+from .realtime import conversa_group, publicar, sala_group
+from .uploads import limite_upload, upload_excedido
 from .models import (
     ChatRoom,
     Usuario,
+    normalizar_nome,
     SolicitacaoClube,
     Mensagem,
     Conversation,
+    ConversaParticipante,
     Recado,
     Clube,
     Topico,
@@ -33,54 +43,83 @@ from .models import (
     Sala,
     SalaMensagem,
     Evento,
-    Post,
-    Tema,
-    Novidade,
+    MidiaVariante,
     WPlaceState,
 )
 
 # Usuario = get_user_model()
 
-waiting_users = []  
-active_rooms = {}
-
-def home(request):
-    session_key = request.session.session_key
-    usuario_logado = Usuario.objects.filter(session_key=session_key).first()
-
-    if not usuario_logado:
-        return render(request, 'chat/home.html', {'usuarios': Usuario.objects.all()})
-
-    clubes_seguidos = usuario_logado.clubes_seguidos.all() if hasattr(usuario_logado, 'clubes_seguidos') else []
-    feed_posts = Post.objects.filter(clube__in=clubes_seguidos).order_by('-data')[:10]
-
-    recados = Recado.objects.all().order_by('-data')[:10]
+# Diretório de usuários: tamanho da página e teto do ?limit=
+DIRETORIO_POR_PAGINA = 30
+DIRETORIO_LIMITE_MAX = 100
+
+def pagina_diretorio(busca='', cursor='', limit=DIRETORIO_POR_PAGINA):
+    """Página do diretório por keyset em (nome_busca, id).
+
+    busca filtra por prefixo do nome (sem acento/maiúsculas); cursor é o
+    "proximo" devolvido pela página anterior. Retorna (usuarios, proximo).
+    """
+    usuarios = Usuario.objects.only('id', 'nome', 'nome_busca', 'emoji')
+    prefixo = normalizar_nome(busca)
+    if prefixo:
+        # Faixa em vez de LIKE: usa o índice em qualquer banco
+        usuarios = usuarios.filter(nome_busca__gte=prefixo, nome_busca__lt=prefixo + '\U0010ffff')
+    if cursor:
+        cursor_id, _, cursor_nome = cursor.partition(':')
+        usuarios = usuarios.filter(
+            Q(nome_busca__gt=cursor_nome) | Q(nome_busca=cursor_nome, id__gt=int(cursor_id))
+        )
 
-    perfil_destaque = Usuario.objects.exclude(id=usuario_logado.id).order_by('?').first()
-    tema_semana = Tema.objects.filter(ativo=True).first()
-    evento_destaque = "Noite Lo-fi no Café Virtual"
+    pagina = list(usuarios.order_by('nome_busca', 'id')[:limit + 1])
+    proximo = None
+    if len(pagina) > limit:
+        pagina = pagina[:limit]
+        proximo = f"{pagina[-1].id}:{pagina[-1].nome_busca}"
+    return pagina, proximo
 
-    clubes_recomendados = Clube.objects.exclude(id__in=[c.id for c in clubes_seguidos])[:5]
 
-    perfis_recomendados = Usuario.objects.exclude(id=usuario_logado.id).annotate(
-        afinidade=Count('gostos')
-    ).order_by('-afinidade')[:5]
+def home(request):
+    usuario_logado = request.usuario
+    usuarios, proximo_usuarios = pagina_diretorio()
 
-    novidades = Novidade.objects.order_by('-data')[:5]
+    if not usuario_logado:
+        return render(request, 'chat/home.html', {
+            'usuarios': usuarios,
+            'proximo_usuarios': proximo_usuarios,
+        })
 
-    usuarios = Usuario.objects.all().order_by('nome')
+    feed = montar_feed(usuario_logado)
 
     return render(request, 'chat/home.html', {
+        **feed,
         "usuario_logado": usuario_logado,
-        "feed_posts": feed_posts,
-        "recados": recados,
-        "perfil_destaque": perfil_destaque,
-        "tema_semana": tema_semana,
-        "evento_destaque": evento_destaque,
-        "clubes_recomendados": clubes_recomendados,
-        "perfis_recomendados": perfis_recomendados,
-        "novidades": novidades,
-        "usuarios": usuarios
+        "evento_destaque": "Noite Lo-fi no Café Virtual",
+        "usuarios": usuarios,
+        "proximo_usuarios": proximo_usuarios,
+    })
+
+
+def diretorio_usuarios_json(request):
+    """?q=<prefixo do nome>&cursor=<proximo da página anterior>&limit=N"""
+    try:
+        limit = min(max(int(request.GET.get('limit', DIRETORIO_POR_PAGINA)), 1), DIRETORIO_LIMITE_MAX)
+        usuarios, proximo = pagina_diretorio(
+            request.GET.get('q', ''), request.GET.get('cursor', ''), limit
+        )
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido'}, status=400)
+
+    return JsonResponse({
+        'usuarios': [
+            {
+                'id': u.id,
+                'nome': u.nome,
+                'emoji': u.emoji,
+                'url': reverse('chat:perfil_usuario', args=[u.id]),
+            }
+            for u in usuarios
+        ],
+        'proximo': proximo,
     })
 
 
@@ -97,13 +136,14 @@ def chat(request):
     if not session_key:
         return render(request, 'chat/waiting.html', {'error': 'Habilite os cookies.'})
 
-    room_id = active_rooms.get(session_key)
+    matchmaker = get_matchmaker()
+    room_id = matchmaker.room_for(session_key)
     if room_id:
         room = ChatRoom.objects.filter(id=room_id).first()
         if room and session_key in (room.user1, room.user2):
             return redirect('chat:chat_view', room_id=room_id)
         else:
-            active_rooms.pop(session_key, None)
+            matchmaker.clear_room(session_key)
 
     return render(request, 'chat/waiting.html')
 
@@ -117,7 +157,7 @@ def chat_view(request, room_id):
 
     request.session['room_id'] = room_id
 
-    usuario_logado = Usuario.objects.filter(id=request.session.get('usuario_id')).first()
+    usuario_logado = request.usuario
     if usuario_logado and usuario_logado.session_key != session_key:
         usuario_logado.session_key = session_key
         usuario_logado.save()
@@ -131,43 +171,46 @@ def chat_view(request, room_id):
         'usuario_logado': usuario_logado,
     })
 
-def leave_chat(request):
+@require_POST
+def chat_media_upload(request, room_id):
+    """Recebe o arquivo como corpo do POST e grava na mídia da sala.
+
+    O corpo é lido em pedaços direto para o disco; quem recebe o arquivo é o
+    socket da sala, que só transporta o id devolvido aqui.
+    """
     session_key = get_session_id(request)
+    room = ChatRoom.objects.filter(id=room_id).first()
+    if not room or session_key not in (room.user1, room.user2):
+        return HttpResponseForbidden()
 
-    global waiting_users, active_rooms
-    waiting_users = [w for w in waiting_users if w['session_key'] != session_key]
+    try:
+        tamanho = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        tamanho = 0
+    if tamanho > limite_upload(request.content_type):
+        return JsonResponse({'erro': 'Arquivo muito grande'}, status=413)
 
-    room_id = request.session.get('room_id')
-    if room_id:
-        active_rooms.pop(session_key, None)
-        request.session.pop('room_id', None)
+    try:
+        media_id = salvar_midia(room.id, request.content_type, iter(lambda: request.read(CHUNK_SIZE), b''))
+    except MediaGrandeDemais as e:
+        return JsonResponse({'erro': str(e)}, status=413)
+    except MediaError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
 
-    return redirect('/')
+    return JsonResponse({'id': media_id, 'url': media_url(room.id, media_id)})
 
 
+def leave_chat(request):
+    session_key = get_session_id(request)
 
-# Variáveis globais simulando fila e salas ativas
-waiting_users = []
-active_rooms = {}
+    get_matchmaker().leave(session_key)
+    request.session.pop('room_id', None)
+
+    return redirect('/')
 
-def normalize_gostos(gostos_raw):
-    if not gostos_raw:
-        return []
-    if isinstance(gostos_raw, list):
-        return [str(g).strip().lower() for g in gostos_raw if str(g).strip()]
-    if isinstance(gostos_raw, str):
-        try:
-            parsed = json.loads(gostos_raw)
-            if isinstance(parsed, list):
-                return [str(g).strip().lower() for g in parsed if str(g).strip()]
-        except Exception:
-            return [g.strip().lower() for g in gostos_raw.split(",") if g.strip()]
-    return [str(gostos_raw).strip().lower()]
 
 @csrf_exempt
 def find_match(request):
-    global waiting_users, active_rooms
-
     if request.method != 'POST':
         return JsonResponse({'error': 'Use POST'}, status=405)
 
@@ -179,83 +222,13 @@ def find_match(request):
     if not session_key:
         return JsonResponse({'error': 'Sem session_key'}, status=400)
 
-    usuario = Usuario.objects.filter(session_key=session_key).first()
+    usuario = request.usuario
     if not usuario:
         return JsonResponse({'error': 'Usuário não encontrado'}, status=400)
 
-    temp_interests = [g.strip().lower() for g in temp_interests_raw.split(",") if g.strip()] if use_temp_interests else []
-
-    # Se já está em sala ativa, retorna imediatamente
-    if session_key in active_rooms:
-        return JsonResponse({'room_id': active_rooms[session_key]})
-
-    # Adiciona o usuário na fila se não estiver
-    if not any(w['session_key'] == session_key for w in waiting_users):
-        waiting_users.append({
-            'session_key': session_key,
-            'temp_interests': temp_interests
-        })
-
-    # Filtra usuários na fila, exceto ele mesmo
-    waiting_usuarios = [w for w in waiting_users if w['session_key'] != session_key]
-
-    # Se nenhum parceiro disponível
-    if not waiting_usuarios:
-        return JsonResponse({'room_id': None})
-
-    user_gostos = normalize_gostos(usuario.gostos)
-
-    parceiros_validos = []
-    for w in waiting_usuarios:
-        partner_user = Usuario.objects.filter(session_key=w['session_key']).first()
-        if not partner_user:
-            continue
-
-        # Ignora se bloqueado
-        if usuario.esta_bloqueado(partner_user):
-            continue
-
-        partner_gostos = normalize_gostos(partner_user.gostos)
-
-        # Verifica gostos temporários se aplicável
-        if use_temp_interests and temp_interests:
-            comum_temp = set(temp_interests) & set(w.get('temp_interests', []))
-            if not comum_temp:
-                continue
-
-        # Verifica gostos fixos do usuário
-        if user_gostos and partner_gostos:
-            comum_gostos = set(user_gostos) & set(partner_gostos)
-            if not comum_gostos:
-                continue
-
-        # Verifica localização igual se definida (não obrigatório, só exemplo)
-        if usuario.localizacao and partner_user.localizacao:
-            if usuario.localizacao.strip().lower() != partner_user.localizacao.strip().lower():
-                # Para aceitar somente mesmo local, descomente a linha abaixo
-                # continue
-                pass
-
-        parceiros_validos.append(partner_user)
-
-    if not parceiros_validos:
-        return JsonResponse({'room_id': None})
+    temp_interests = parse_temp_interests(temp_interests_raw) if use_temp_interests else []
 
-    partner_user = parceiros_validos[0]
-
-    new_room_id = str(uuid.uuid4())[:8]
-    ChatRoom.objects.create(id=new_room_id, user1=usuario.session_key, user2=partner_user.session_key)
-
-    active_rooms[usuario.session_key] = new_room_id
-    active_rooms[partner_user.session_key] = new_room_id
-
-    # Remove ambos da fila
-    waiting_users = [
-        w for w in waiting_users
-        if w['session_key'] not in (usuario.session_key, partner_user.session_key)
-    ]
-
-    return JsonResponse({'room_id': new_room_id})
+    return JsonResponse({'room_id': find_partner(session_key, usuario, temp_interests)})
 
 
 def clubes(request):
@@ -268,7 +241,7 @@ def profile(request):
     if not usuario_id:
         return redirect('chat:login')
 
-    usuario = Usuario.objects.get(id=usuario_id)
+    usuario = get_usuario_logado(request)
 
     # Atualiza o contador de acessos consecutivos
     usuario.registrar_acesso()
@@ -276,13 +249,14 @@ def profile(request):
     # Passa os clubes do usuário para o template
     clubes = usuario.clubes.all()
 
-    recados = Recado.objects.filter(perfil=usuario).order_by('-data')
+    recados, proximo_recados = pagina_recados(usuario)
 
     return render(request, 'chat/profile.htm', {
         'usuario': usuario,
         'usuario_logado': usuario,  # para compatibilidade com outros templates
         'clubes': clubes,
         'recados': recados,
+        'proximo_recados': proximo_recados,
     })
 
 
@@ -294,7 +268,7 @@ def editar_perfil_view(request):
     if not usuario_id:
         return redirect('chat:login')  # Ou onde quiser
 
-    usuario = Usuario.objects.get(id=usuario_id)
+    usuario = get_usuario_logado(request)
     
     # Passe os dados do usuário para popular o formulário
     context = {
@@ -313,9 +287,13 @@ def editar_perfil(request):
             return JsonResponse({'erro': 'Não autenticado'}, status=401)
 
         data = json.loads(request.body)
-        usuario = Usuario.objects.get(id=usuario_id)
+        usuario = get_usuario_logado(request)
 
-        usuario.foto = data.get('pic')
+        try:
+            # Data URL vira arquivo; no banco fica só a URL
+            usuario.foto = salvar_avatar(data.get('pic'))
+        except AvatarError as e:
+            return JsonResponse({'erro': str(e)}, status=400)
         usuario.emoji = data.get('emotion')
         usuario.nome = data.get('name')
         usuario.descricao = data.get('description')
@@ -461,10 +439,10 @@ def adicionar_amigo(request, usuario_id):
         if not logado_id:
             return redirect('chat:login')
 
-        logado = get_object_or_404(Usuario, id=logado_id)
+        logado = get_usuario_logado(request)
         amigo = get_object_or_404(Usuario, id=usuario_id)
 
-        if amigo in logado.amigos.all():
+        if logado.amigos.filter(pk=amigo.pk).exists():
             logado.amigos.remove(amigo)  # remover amizade
         else:
             logado.amigos.add(amigo)  # adicionar amizade
@@ -475,15 +453,20 @@ def adicionar_amigo(request, usuario_id):
 
 
 def get_usuario_logado(request):
-    uid = request.session.get('usuario_id')
-    return get_object_or_404(Usuario, id=uid)
+    usuario = usuario_da_request(request)
+    if usuario is None:
+        raise Http404("Usuário não encontrado")
+    return usuario
 
 def perfil_usuario(request, usuario_id):
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    retrato = retrato_perfil(usuario_id)
+    if retrato is None:
+        raise Http404("Usuário não encontrado")
+    usuario = retrato['usuario']
     usuario_logado = get_usuario_logado(request)
 
     # Bloqueio: se o usuário logado está bloqueado pelo dono do perfil, bloqueie o acesso
-    if usuario_logado in usuario.bloqueados.all():
+    if usuario_logado.foi_bloqueado_por(usuario):
         return HttpResponseForbidden("Você foi bloqueado por este usuário e não pode acessar o perfil.")
 
     # Opcional: se quiser evitar que alguém veja o próprio perfil via essa view (depende da sua lógica)
@@ -491,21 +474,67 @@ def perfil_usuario(request, usuario_id):
         # Pode redirecionar para a própria página de perfil privada ou apenas permitir
         pass
 
-    # cria ou recupera a conversation
-    conv = Conversation.get_or_create_conversation(usuario_logado, usuario)
-
-    # busca recados e adiciona posições aleatórias
-    recados = Recado.objects.filter(perfil=usuario).order_by('-data')
-    
+    # O retrato (perfil, amigos, clubes, primeira página do mural) vem do
+    # cache; aqui só o que depende de quem visita. A conversation só é criada
+    # quando o chat é aberto (abrir_conversa).
     return render(request, 'chat/profile_publico.html', {
-        'usuario': usuario,
-        'ja_amigo': usuario in usuario_logado.amigos.all(),
-        'conv_id': conv.id,
-        'recados': recados,
+        **retrato,
+        'ja_amigo': usuario_logado.amigos.filter(pk=usuario.pk).exists(),
+        'ja_bloqueado': usuario_logado.esta_bloqueado(usuario),
         'usuario_logado': usuario_logado
     })
 
 
+def abrir_conversa(request, usuario_id):
+    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario_logado = get_usuario_logado(request)
+
+    if usuario_logado == usuario:
+        return redirect('chat:profile')
+    if usuario_logado.foi_bloqueado_por(usuario):
+        return HttpResponseForbidden("Você foi bloqueado por este usuário.")
+
+    conv = Conversation.get_or_create_conversation(usuario_logado, usuario)
+    return redirect('chat:conversation', conv_id=conv.id)
+
+
+def serializar_recado(recado, usuario=None):
+    """Recado para o JS do mural; pode_excluir segue as regras das views de exclusão."""
+    return {
+        'id': recado.id,
+        'autor': recado.autor,
+        'foto': recado.foto,
+        'texto': recado.texto,
+        'reacoes': recado.reacoes,
+        'data': recado.data.strftime('%d/%m'),
+        'left': recado.left,
+        'top': recado.top,
+        'z_index': recado.z_index,
+        'pode_excluir': bool(usuario) and (
+            usuario.id == recado.perfil_id or usuario.nome == recado.autor
+        ),
+    }
+
+
+def recados_mural_json(request, usuario_id):
+    """?cursor=<proximo da página anterior>&limit=N"""
+    perfil = get_object_or_404(Usuario, id=usuario_id)
+    usuario_logado = request.usuario or None
+    if usuario_logado and usuario_logado.foi_bloqueado_por(perfil):
+        return JsonResponse({'erro': 'Bloqueado'}, status=403)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', RECADOS_POR_PAGINA)), 1), RECADOS_LIMITE_MAX)
+        recados, proximo = pagina_recados(perfil, request.GET.get('cursor', ''), limit)
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido'}, status=400)
+
+    return JsonResponse({
+        'recados': [serializar_recado(r, usuario_logado) for r in recados],
+        'proximo': proximo,
+    })
+
+
 
 
 @csrf_exempt
@@ -513,12 +542,15 @@ def perfil_usuario(request, usuario_id):
 def enviar_recado(request, usuario_id):
     try:
         perfil = get_object_or_404(Usuario, id=usuario_id)
-        usuario_logado = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+        usuario_logado = get_usuario_logado(request)
 
         data = json.loads(request.body)
         texto = data.get('texto', '').strip()
         reacoes = data.get('reacoes', '').strip()
-        foto = data.get('foto') or usuario_logado.foto or 'https://i.pravatar.cc/44'
+        try:
+            foto = url_mini(salvar_avatar(data.get('foto') or usuario_logado.foto)) or 'https://i.pravatar.cc/44'
+        except AvatarError as e:
+            return JsonResponse({'status': 'erro', 'msg': str(e)}, status=400)
         left = int(data.get('left', random.randint(10, 280)))
         top = int(data.get('top', random.randint(60, 160)))
 
@@ -537,22 +569,17 @@ def enviar_recado(request, usuario_id):
 
         return JsonResponse({
             'status': 'ok',
-            'recado': {
-                'id': recado.id,
-                'autor': recado.autor,
-                'foto': recado.foto,
-                'texto': recado.texto,
-                'reacoes': recado.reacoes,
-                'data': recado.data.strftime('%d/%m'),
-                'left': recado.left,
-                'top': recado.top
-            }
+            'recado': serializar_recado(recado, usuario_logado)
         })
     except Exception as e:
         return JsonResponse({'status': 'erro', 'msg': str(e)}, status=500)
 
 
 
+# Tamanho da janela de mensagens no carregamento e no scrollback
+MENSAGENS_POR_PAGINA = 50
+MENSAGENS_LIMITE_MAX = 200
+
 def conversation_view(request, conv_id):
     conv = get_object_or_404(Conversation, id=conv_id)
     usuario_logado = get_usuario_logado(request)
@@ -560,20 +587,51 @@ def conversation_view(request, conv_id):
     if usuario_logado not in (conv.user1, conv.user2):
         return redirect('chat:home')
 
-    mensagens = Mensagem.objects.filter(conversation=conv).order_by('timestamp')
+    amigo = conv.user2 if usuario_logado == conv.user1 else conv.user1
 
-    # Marcar como "vistas"
-    for msg in mensagens:
-        if msg.remetente != usuario_logado and not msg.visto_por.filter(id=usuario_logado.id).exists():
-            msg.visto_por.add(usuario_logado)
+    # Só as mensagens mais recentes; as anteriores vêm do JSON com ?before=
+    janela = list(
+        Mensagem.objects.filter(conversation=conv)
+        .select_related('remetente')
+        .order_by('-id')[:MENSAGENS_POR_PAGINA + 1]
+    )
+    tem_anteriores = len(janela) > MENSAGENS_POR_PAGINA
+    janela = anexar_variantes(janela[:MENSAGENS_POR_PAGINA][::-1], 'midia', 'audio')
 
-    amigo = conv.user2 if usuario_logado == conv.user1 else conv.user1
+    # Marcar como "vistas": só avança a marca de leitura até a última mensagem
+    if janela:
+        conv.marcar_lida(usuario_logado, janela[-1].id)
+
+    # Até onde o amigo leu, para as mensagens enviadas já virem com ✓✓
+    lido_pelo_amigo = ConversaParticipante.objects.filter(
+        conversation=conv, usuario=amigo
+    ).values_list('lido_ate', flat=True).first() or 0
 
     return render(request, 'chat/conversation.html', {
         'conv_id': conv.id,
         'amigo': amigo,
-        'mensagens': mensagens,
+        'mensagens': janela,
+        'tem_anteriores': tem_anteriores,
+        'lido_pelo_amigo': lido_pelo_amigo,
+    })
+
+
+def criar_mensagem_conversa(conv, remetente, destinatario, conteudo, audio=None, midia=None):
+    """Grava a mensagem e entrega para quem está com a conversa aberta (ConversationConsumer)."""
+    msg = Mensagem.objects.create(
+        conversation=conv,
+        remetente=remetente,
+        destinatario=destinatario,
+        conteudo=conteudo,
+        audio=audio,
+        midia=midia
+    )
+    ConversaParticipante.registrar_mensagem(msg)
+    publicar(conversa_group(conv.id), {
+        'type': 'conversa_mensagem',
+        'mensagem': serializar_mensagem(msg),
     })
+    return msg
 
 
 @csrf_exempt
@@ -599,6 +657,8 @@ def send_conversation_message(request, conv_id):
         except (json.JSONDecodeError, UnicodeDecodeError):
             return JsonResponse({'status': 'erro', 'msg': 'JSON inválido'}, status=400)
     else:
+        if upload_excedido(request):
+            return JsonResponse({'status': 'erro', 'msg': 'Arquivo muito grande'}, status=413)
         conteudo = request.POST.get('conteudo', '').strip()
         audio = request.FILES.get('audio')
         midia = request.FILES.get('midia')
@@ -606,56 +666,95 @@ def send_conversation_message(request, conv_id):
     if not any([conteudo, audio, midia]):
         return JsonResponse({'status': 'erro', 'msg': 'Nada para enviar'}, status=400)
 
-    Mensagem.objects.create(
-        conversation=conv,
-        remetente=usuario,
-        destinatario=destinatario,
-        conteudo=conteudo,
-        audio=audio,
-        midia=midia
-    )
+    criar_mensagem_conversa(conv, usuario, destinatario, conteudo, audio, midia)
 
     return JsonResponse({'status': 'ok'})
 
 
+def serializar_mensagem(m):
+    # Menor versão adequada já gerada (ver anexar_variantes); senão o original
+    variantes = getattr(m, 'variantes', {})
+    audio_url = variantes.get('audio', {}).get('audio') or (m.audio.url if m.audio else None)
+    midia_variante_url = variantes.get('midia', {}).get('thumb') or variantes.get('midia', {}).get('audio')
+
+    return {
+        'id': m.id,
+        'remetente': m.remetente.nome,
+        'remetente_id': m.remetente.id,
+        'conteudo': m.conteudo,
+        'audio_url': audio_url,
+        'midia_url': m.midia.url if m.midia else None,
+        'midia_variante_url': midia_variante_url,
+        'midia_tipo': m.midia_tipo or None,
+        'midia_nome': m.midia_nome,
+        'midia_tamanho': m.midia_tamanho,
+        'midia_largura': m.midia_largura,
+        'midia_altura': m.midia_altura,
+        'timestamp': m.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
 def conversation_messages_json(request, conv_id):
+    """Mensagens da conversa por cursor (id da mensagem).
+
+    ?after=<id>  só as mensagens novas depois do cursor (polling)
+    ?before=<id> as anteriores ao cursor (scrollback)
+    sem cursor   as mais recentes
+    after e before juntos são 400. Todas aceitam &limit=N. A resposta leva ETag do último id da conversa,
+    dos parâmetros da página e da última variante de mídia gerada para ela,
+    então um polling sem novidade volta 304 sem serializar nada e uma página
+    revalidada muda quando a miniatura fica pronta.
+    """
     conv = get_object_or_404(Conversation, id=conv_id)
     usuario_logado = get_usuario_logado(request)
 
     if usuario_logado not in (conv.user1, conv.user2):
         return JsonResponse({'status': 'erro', 'msg': 'Não autorizado'}, status=403)
 
-    mensagens = Mensagem.objects.filter(conversation=conv).order_by('timestamp')
-    resultado = []
-
-    for m in mensagens:
-        midia_url = m.midia.url if m.midia else None
-        midia_tipo = None
-        if m.midia:
-            mimetype, _ = mimetypes.guess_type(m.midia.url)
-            if mimetype:
-                if mimetype.startswith('image'):
-                    midia_tipo = 'imagem'
-                elif mimetype.startswith('video'):
-                    midia_tipo = 'video'
-                elif mimetype.startswith('application'):
-                    midia_tipo = 'documento'
-                else:
-                    midia_tipo = 'outro'
-
-        resultado.append({
-            'id': m.id,
-            'remetente': m.remetente.nome,
-            'remetente_id': m.remetente.id,
-            'conteudo': m.conteudo,
-            'audio_url': m.audio.url if m.audio else None,
-            'midia_url': midia_url,
-            'midia_tipo': midia_tipo,
-            'midia_nome': m.midia.name.split('/')[-1] if m.midia else '',
-            'timestamp': m.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-        })
-
-    return JsonResponse({'mensagens': resultado})
+    try:
+        after = int(request.GET.get('after', 0))
+        before = int(request.GET.get('before', 0))
+        limit = min(int(request.GET.get('limit', MENSAGENS_POR_PAGINA)), MENSAGENS_LIMITE_MAX)
+    except ValueError:
+        return JsonResponse({'status': 'erro', 'msg': 'Cursor inválido'}, status=400)
+    if after and before:
+        return JsonResponse({'status': 'erro', 'msg': 'Use after ou before, não os dois'}, status=400)
+    limit = max(limit, 1)
+
+    mensagens = Mensagem.objects.filter(conversation=conv)
+    ultimo_id = mensagens.aggregate(ultimo=Max('id'))['ultimo'] or 0
+
+    mensagens = mensagens.select_related('remetente')
+    if after:
+        pagina = list(mensagens.filter(id__gt=after).order_by('id')[:limit + 1])
+        tem_mais = len(pagina) > limit
+        pagina = pagina[:limit]
+    else:
+        if before:
+            mensagens = mensagens.filter(id__lt=before)
+        pagina = list(mensagens.order_by('-id')[:limit + 1])
+        tem_mais = len(pagina) > limit
+        pagina = pagina[:limit][::-1]
+
+    nomes = [arquivo.name for m in pagina for arquivo in (m.midia, m.audio) if arquivo]
+    ultima_variante = 0
+    if nomes:
+        ultima_variante = MidiaVariante.objects.filter(original__in=nomes).aggregate(ultima=Max('id'))['ultima'] or 0
+    etag = f'"{ultimo_id}-{after}-{before}-{limit}-{ultima_variante}"'
+    nao_mudou = get_conditional_response(request, etag=etag)
+    if nao_mudou is not None:
+        return nao_mudou
+
+    anexar_variantes(pagina, 'midia', 'audio')
+
+    response = JsonResponse({
+        'mensagens': [serializar_mensagem(m) for m in pagina],
+        'tem_mais': tem_mais,
+        'ultimo_id': ultimo_id,
+    })
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @csrf_exempt
@@ -673,41 +772,81 @@ def enviar_mensagem(request, conv_id):
     if not texto and not audio and not midia:
         return JsonResponse({'status': 'erro', 'msg': 'Nada enviado'}, status=400)
 
-    Mensagem.objects.create(
-        conversation=conv,
-        remetente=usuario_logado,
-        destinatario=destinatario,
-        conteudo=texto,
-        audio=audio,
-        midia=midia
-    )
+    criar_mensagem_conversa(conv, usuario_logado, destinatario, texto, audio, midia)
     return JsonResponse({'status': 'ok'})
 
 
 
 
 
-@csrf_exempt
+# Máximo de recados por requisição de layout
+RECADOS_LAYOUT_MAX = 200
+
+
+def aplicar_layout_recados(itens, perfil_id, usuario):
+    """Grava left/top/z_index de vários recados do mural de ``perfil_id`` com um único UPDATE.
+
+    ``itens`` é uma lista de dicts ``{id, left, top, z_index}``; ``z_index``
+    pode faltar ou vir None. Se o mesmo id aparecer mais de uma vez, vale o
+    último. O dono do mural arruma qualquer recado dele; os outros, só os que
+    escreveram. Ids de outro mural ou de outro autor são ignorados. Retorna
+    quantos recados foram atualizados.
+    """
+    posicoes = {}
+    for item in itens:
+        z_index = item.get('z_index')
+        posicoes[int(item['id'])] = (
+            int(item.get('left', 0)),
+            int(item.get('top', 0)),
+            int(z_index) if z_index is not None else None,
+        )
+
+    recados = Recado.objects.filter(perfil_id=perfil_id)
+    if usuario.id != perfil_id:
+        recados = recados.filter(autor=usuario.nome)
+    recados = recados.only('id', 'left', 'top', 'z_index').in_bulk(list(posicoes))
+    for recado_id, recado in recados.items():
+        recado.left, recado.top, z_index = posicoes[recado_id]
+        if z_index is not None:
+            recado.z_index = z_index
+
+    Recado.objects.bulk_update(recados.values(), ['left', 'top', 'z_index'])
+    # bulk_update não dispara sinais; o mural em cache guarda as posições
+    if recados:
+        invalidar_perfil(perfil_id)
+    return len(recados)
+
+
 @require_POST
-def mover_recado(request, recado_id):
+def layout_recados(request):
+    """Recebe ``{"perfil": id do mural, "recados": [{id, left, top, z_index}, ...]}`` de uma vez."""
+    if not request.usuario:
+        return JsonResponse({'status': 'erro', 'detalhe': 'Não autenticado'}, status=401)
     try:
         data = json.loads(request.body)
-        left = int(data.get('left', 0))
-        top = int(data.get('top', 0))
-        z_index = data.get('z_index')  # pode vir como None
+        perfil_id = int(data['perfil'])
+        itens = data.get('recados') or []
+        if not isinstance(itens, list):
+            raise ValueError('recados deve ser uma lista')
+        if len(itens) > RECADOS_LAYOUT_MAX:
+            raise ValueError(f'no máximo {RECADOS_LAYOUT_MAX} recados por vez')
+        atualizados = aplicar_layout_recados(itens, perfil_id, request.usuario)
+        return JsonResponse({'status': 'ok', 'atualizados': atualizados})
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        return JsonResponse({'status': 'erro', 'detalhe': str(e)}, status=400)
 
-        print(f"Movendo recado {recado_id} para left={left}, top={top}, z_index={z_index}")
 
+@require_POST
+def mover_recado(request, recado_id):
+    if not request.usuario:
+        return JsonResponse({'status': 'erro', 'detalhe': 'Não autenticado'}, status=401)
+    try:
+        data = json.loads(request.body)
         recado = get_object_or_404(Recado, id=recado_id)
-        recado.left = left
-        recado.top = top
-        if z_index is not None:
-            recado.z_index = int(z_index)
-        recado.save()
-
+        if not aplicar_layout_recados([{**data, 'id': recado_id}], recado.perfil_id, request.usuario):
+            return JsonResponse({'status': 'erro', 'detalhe': 'Não autorizado'}, status=403)
         return JsonResponse({'status': 'ok'})
-    except Exception as e:
-        print(f"Erro ao mover recado: {e}")
+    except (ValueError, TypeError, AttributeError) as e:
         return JsonResponse({'status': 'erro', 'detalhe': str(e)}, status=400)
 
 @csrf_exempt
@@ -718,7 +857,7 @@ def excluir_recado(request, recado_id):
         if not usuario_id:
             return JsonResponse({'status': 'erro', 'msg': 'Não autenticado'}, status=401)
 
-        usuario_logado = get_object_or_404(Usuario, id=usuario_id)
+        usuario_logado = get_usuario_logado(request)
         recado = get_object_or_404(Recado, id=recado_id)
 
         if recado.autor != usuario_logado.nome:
@@ -741,7 +880,7 @@ def excluir_recado_usuario(request, recado_id):
             return JsonResponse({'status': 'erro', 'msg': 'Não autenticado'}, status=401)
 
         # Só garante que o usuário existe, mas não bloqueia exclusão
-        usuario_logado = get_object_or_404(Usuario, id=usuario_id)
+        usuario_logado = get_usuario_logado(request)
 
         recado = get_object_or_404(Recado, id=recado_id)
         recado.delete()
@@ -770,27 +909,42 @@ def clubes_lista(request):
 
 
 
+# Lista de membros do clube: tamanho da página e teto do ?limit=
+MEMBROS_POR_PAGINA = 50
+MEMBROS_LIMITE_MAX = 200
+
+def pagina_membros(clube, cursor=0, limit=MEMBROS_POR_PAGINA):
+    """Página de membros por keyset em id. Retorna (membros, proximo)."""
+    membros = Usuario.objects.filter(clubes=clube, id__gt=cursor).only('id', 'nome')
+    pagina = list(membros.order_by('id')[:limit + 1])
+    proximo = None
+    if len(pagina) > limit:
+        pagina = pagina[:limit]
+        proximo = pagina[-1].id
+    return pagina, proximo
+
+
 def clubes_detalhe(request, pk):
     clube = get_object_or_404(Clube, pk=pk)
-    usuario_id = request.session.get('usuario_id')
-    usuario_logado = Usuario.objects.filter(id=usuario_id).first()
-    membros = Usuario.objects.filter(clubes=clube)
+    usuario_logado = request.usuario
+    membros, proximo_membros = pagina_membros(clube)
 
     mods_list = [mod.strip() for mod in clube.mods.split(',')] if clube.mods else []
-    usuario_no_clube = usuario_logado in membros if usuario_logado else False
+    usuario_no_clube = clube.tem_membro(usuario_logado)
     usuario_e_dono = usuario_logado.nome == clube.dono if usuario_logado else False
 
     topicos = Topico.objects.filter(clube=clube).order_by('-criado_em')
 
     # 👉 aqui está o filtro de eventos ativos
     agora = timezone.now()
-    eventos_ativos = clube.eventos.filter(
+    eventos_ativos = anexar_variantes(clube.eventos.filter(
         Q(data_fim__isnull=True) | Q(data_fim__gt=agora)
-    ).order_by('data_inicio')
+    ).order_by('data_inicio'), 'banner')
 
     return render(request, 'chat/clubes_detalhe.html', {
         'clube': clube,
         'membros': membros,
+        'proximo_membros': proximo_membros,
         'moderadores': mods_list,
         'usuario_no_clube': usuario_no_clube,
         'usuario_e_dono': usuario_e_dono,
@@ -800,10 +954,32 @@ def clubes_detalhe(request, pk):
     })
 
 
+def clube_membros_json(request, pk):
+    """?cursor=<proximo da página anterior>&limit=N"""
+    clube = get_object_or_404(Clube, pk=pk)
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+        limit = min(max(int(request.GET.get('limit', MEMBROS_POR_PAGINA)), 1), MEMBROS_LIMITE_MAX)
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido'}, status=400)
+
+    membros, proximo = pagina_membros(clube, cursor, limit)
+    return JsonResponse({
+        'membros': [
+            {
+                'id': m.id,
+                'nome': m.nome,
+                'url': reverse('chat:perfil_usuario', args=[m.id]),
+            }
+            for m in membros
+        ],
+        'proximo': proximo,
+    })
+
+
 
 def clubes_criar(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario_logado = get_object_or_404(Usuario, id=usuario_id)
+    usuario_logado = get_usuario_logado(request)
 
     if request.method == 'POST':
         form = ClubeForm(request.POST)
@@ -811,7 +987,7 @@ def clubes_criar(request):
             clube = form.save(commit=False)
             clube.dono = usuario_logado.nome
             clube.save()
-            usuario_logado.clubes.add(clube)
+            clube.adicionar_membro(usuario_logado)
             return redirect('chat:clubes_detalhe', pk=clube.pk)
     else:
         form = ClubeForm()
@@ -820,8 +996,7 @@ def clubes_criar(request):
 
 
 def clubes_editar(request, pk):
-    usuario_id = request.session.get('usuario_id')
-    usuario_logado = get_object_or_404(Usuario, id=usuario_id)
+    usuario_logado = get_usuario_logado(request)
 
     clube = get_object_or_404(Clube, pk=pk)
     mods_list = [mod.strip() for mod in clube.mods.split(',')] if clube.mods else []
@@ -841,16 +1016,15 @@ def clubes_editar(request, pk):
 
 @require_POST
 def clubes_entrar(request, pk):
-    usuario_id = request.session.get('usuario_id')
-    usuario_logado = get_object_or_404(Usuario, id=usuario_id)
+    usuario_logado = get_usuario_logado(request)
     clube = get_object_or_404(Clube, pk=pk)
 
     # Já está no clube
-    if usuario_logado.clubes.filter(id=clube.id).exists():
+    if clube.tem_membro(usuario_logado):
         return redirect('chat:clubes_detalhe', pk=clube.id)
 
     if clube.tipo == 'Pública':
-        usuario_logado.clubes.add(clube)
+        clube.adicionar_membro(usuario_logado)
 
     elif clube.tipo == 'Privada':
         # Remove qualquer solicitação antiga desse usuário
@@ -863,7 +1037,7 @@ def clubes_entrar(request, pk):
         SolicitacaoClube.objects.create(
             clube=clube,
             usuario_nome=usuario_logado.nome,
-            foto_url=usuario_logado.foto  # <-- Adiciona isso
+            foto_url=url_mini(usuario_logado.foto)  # <-- Adiciona isso
         )
 
 
@@ -878,17 +1052,17 @@ def clubes_entrar(request, pk):
 
 @require_POST
 def clubes_sair(request, pk):
-    usuario_id = request.session.get('usuario_id')
-    usuario_logado = get_object_or_404(Usuario, id=usuario_id)
+    usuario_logado = get_usuario_logado(request)
     clube = get_object_or_404(Clube, pk=pk)
 
-    usuario_logado.clubes.remove(clube)
+    clube.remover_membro(usuario_logado)
     return redirect('chat:clubes_lista')
 
 
 def clube_nova_discussao(request, clube_id):
-    usuario_id = request.session.get('usuario_id')
-    usuario_logado = get_object_or_404(Usuario, id=usuario_id)
+    usuario_logado = get_usuario_logado(request)
+    if request.method == 'POST' and upload_excedido(request):
+        return HttpResponse("Arquivo muito grande.", status=413)
     arquivo = request.FILES.get('arquivo_midia')  # arquivo enviado no form
     if request.method == 'POST':
         # Supondo que você esteja criando um novo tópico
@@ -921,10 +1095,8 @@ def construir_arvore_respostas(respostas):
 def clube_topico(request, clube_id, topico_id):
     clube = get_object_or_404(Clube, pk=clube_id)
     topico = get_object_or_404(Topico, pk=topico_id, clube=clube)
-    usuario_id = request.session.get('usuario_id')
-    usuario_logado = Usuario.objects.filter(id=usuario_id).first()
-    membros = Usuario.objects.filter(clubes=clube)
-    usuario_no_clube = usuario_logado in membros if usuario_logado else False
+    usuario_logado = request.usuario
+    usuario_no_clube = clube.tem_membro(usuario_logado)
 
     if request.method == 'POST' and usuario_no_clube:
         conteudo = request.POST.get('comentario', '').strip()
@@ -945,6 +1117,7 @@ def clube_topico(request, clube_id, topico_id):
     # Query simples, sem select_related
     respostas_qs = Resposta.objects.filter(topico=topico).order_by('criado_em')
     respostas_organizadas = construir_arvore_respostas(respostas_qs)
+    anexar_variantes([topico], 'arquivo_midia')
 
     return render(request, 'chat/clube_topico.html', {
         'clube': clube,
@@ -967,20 +1140,74 @@ def criar_sala(request, clube_id):
 
 
 
+# Mensagens da sala renderizadas/enviadas por vez
+SALA_MENSAGENS_POR_PAGINA = 100
+
+def janela_sala(sala, after=None, before=None, limit=SALA_MENSAGENS_POR_PAGINA):
+    """Página de mensagens da sala por keyset em (criado_em, id).
+
+    after/before são ids de mensagem usados como cursor. Sem cursor, devolve
+    as mais recentes. Retorna (mensagens em ordem cronológica, tem_mais).
+    """
+    mensagens = sala.mensagens.all()
+    cursor_id = after or before
+    if cursor_id:
+        cursor_em = SalaMensagem.objects.filter(pk=cursor_id, sala=sala).values_list('criado_em', flat=True).first()
+        if cursor_em is None:
+            return [], False
+        if after:
+            mensagens = mensagens.filter(Q(criado_em__gt=cursor_em) | Q(criado_em=cursor_em, id__gt=cursor_id))
+        else:
+            mensagens = mensagens.filter(Q(criado_em__lt=cursor_em) | Q(criado_em=cursor_em, id__lt=cursor_id))
+
+    if after:
+        pagina = list(mensagens.order_by('criado_em', 'id')[:limit + 1])
+        return pagina[:limit], len(pagina) > limit
+
+    pagina = list(mensagens.order_by('-criado_em', '-id')[:limit + 1])
+    return pagina[:limit][::-1], len(pagina) > limit
+
+
 def sala_detalhe(request, sala_id):
     sala = get_object_or_404(Sala, pk=sala_id)
-    mensagens = sala.mensagens.order_by('criado_em')[:100]
+    mensagens, tem_anteriores = janela_sala(sala)
 
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id) if usuario_id else None
+    usuario = request.usuario or None
 
     return render(request, 'chat/sala_detalhe.html', {
         'sala': sala,
         'mensagens': mensagens,
+        'tem_anteriores': tem_anteriores,
         'usuario': usuario,
     })
 
 
+def sala_mensagens_json(request, sala_id):
+    """?after=<id> mensagens novas; ?before=<id> anteriores; &limit=N."""
+    sala = get_object_or_404(Sala, pk=sala_id)
+    try:
+        after = int(request.GET.get('after', 0))
+        before = int(request.GET.get('before', 0))
+        limit = min(max(int(request.GET.get('limit', SALA_MENSAGENS_POR_PAGINA)), 1), SALA_MENSAGENS_POR_PAGINA)
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido'}, status=400)
+
+    mensagens, tem_mais = janela_sala(sala, after=after, before=before, limit=limit)
+    return JsonResponse({
+        'mensagens': [serializar_sala_mensagem(m) for m in mensagens],
+        'tem_mais': tem_mais,
+    })
+
+
+def serializar_sala_mensagem(msg):
+    return {
+        'id': msg.id,
+        'autor': msg.autor,
+        'texto': msg.texto,
+        'criado_em': timezone.localtime(msg.criado_em).strftime('%H:%M')
+    }
+
+
 @csrf_exempt
 def enviar_mensagem(request, sala_id):
     if request.method == "POST":
@@ -990,17 +1217,15 @@ def enviar_mensagem(request, sala_id):
 
         if texto:
             msg = SalaMensagem.objects.create(sala=sala, autor=autor, texto=texto)
-            return JsonResponse({
-                'autor': msg.autor,
-                'texto': msg.texto,
-                'criado_em': msg.criado_em.strftime('%H:%M')
-            })
+            dados = serializar_sala_mensagem(msg)
+            # Quem está com a sala aberta recebe só a mensagem nova (SalaConsumer)
+            publicar(sala_group(sala.id), {'type': 'sala_mensagem', 'mensagem': dados})
+            return JsonResponse(dados)
     return JsonResponse({'erro': 'Mensagem inválida'}, status=400)
 
 def gerenciar_solicitacoes(request, pk):
     clube = get_object_or_404(Clube, pk=pk)
-    usuario_id = request.session.get('usuario_id')
-    usuario_logado = get_object_or_404(Usuario, id=usuario_id)
+    usuario_logado = get_usuario_logado(request)
 
     nome_usuario = usuario_logado.nome
     mods_list = [mod.strip() for mod in clube.mods.split(',')] if clube.mods else []
@@ -1021,7 +1246,7 @@ def gerenciar_solicitacoes(request, pk):
             sol.save()
             usuario = Usuario.objects.filter(nome=sol.usuario_nome).first()
             if usuario:
-                usuario.clubes.add(clube)
+                clube.adicionar_membro(usuario)
             messages.success(request, f"{sol.usuario_nome} agora faz parte do clube.")
         elif acao == 'rejeitar':
             sol.rejeitado = True
@@ -1045,7 +1270,7 @@ def clubes_aprovar_solicitacao(request, clube_id, solicitacao_id):
         # adiciona o usuário como membro
         usuario = Usuario.objects.filter(nome=solicitacao.usuario_nome).first()
         if usuario:
-            usuario.clubes.add(clube)
+            clube.adicionar_membro(usuario)
 
     return redirect('chat:clubes_detalhe', pk=clube_id)
 
@@ -1065,44 +1290,43 @@ def notificacoes(request):
     if not usuario_id:
         return redirect('chat:login')
 
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = get_usuario_logado(request)
 
-    solicitacoes_raw = SolicitacaoClube.objects.filter(clube__dono=usuario.nome)
+    solicitacoes_raw = list(
+        SolicitacaoClube.objects.filter(clube__dono=usuario.nome).select_related('clube')
+    )
 
-    # Junta o objeto do usuário para pegar a foto
-    solicitacoes_clubes = []
-    for s in solicitacoes_raw:
-        try:
-            u = Usuario.objects.get(nome=s.usuario_nome)
-            foto = u.foto if u.foto else ''
-        except Usuario.DoesNotExist:
-            foto = ''
-        solicitacoes_clubes.append({
+    # Junta a foto dos usuários numa consulta só
+    fotos = dict(
+        Usuario.objects.filter(nome__in={s.usuario_nome for s in solicitacoes_raw})
+        .values_list('nome', 'foto')
+    )
+    solicitacoes_clubes = [
+        {
             'usuario_nome': s.usuario_nome,
             'clube': s.clube,
-            'foto_url': foto,
-        })
-
-
-    conversas_brutas = Conversation.objects \
-        .filter(Q(user1=usuario) | Q(user2=usuario)) \
-        .annotate(ultima_msg=Max('mensagens__timestamp')) \
-        .order_by('-ultima_msg')
+            'foto_url': url_mini(fotos.get(s.usuario_nome)) or '',
+        }
+        for s in solicitacoes_raw
+    ]
 
-    conversas = []
-    for conversa in conversas_brutas:
-        amigo = conversa.user2 if conversa.user1 == usuario else conversa.user1
-        ultima_msg = conversa.mensagens.last()
-        nao_visto = (
-            ultima_msg and
-            ultima_msg.remetente != usuario and
-            not ultima_msg.visto_por.filter(id=usuario.id).exists()
-        )
-        conversas.append({
-            'conversa': conversa,
-            'amigo': amigo,
-            'nao_visto': nao_visto,
-        })
+    # Caixa de entrada mantida a cada envio/leitura (ConversaParticipante)
+    caixa = ConversaParticipante.objects \
+        .filter(usuario=usuario, ultima_mensagem__isnull=False) \
+        .select_related('amigo') \
+        .order_by('-atualizado_em')
+
+    conversas = [
+        {
+            'conversa_id': item.conversation_id,
+            'amigo': item.amigo,
+            'nao_visto': item.nao_lidas > 0,
+            'nao_lidas': item.nao_lidas,
+            'preview': item.preview,
+            'atualizado_em': item.atualizado_em,
+        }
+        for item in caixa
+    ]
 
     return render(request, 'chat/notificacoes.html', {
         'solicitacoes_clubes': solicitacoes_clubes,
@@ -1120,9 +1344,15 @@ def criar_evento(request, clube_id):
     if clube.dono != usuario.nome:
         return HttpResponseForbidden("Apenas o dono do clube pode criar eventos.")
 
+    status = 200
     if request.method == 'POST':
+        excedido = upload_excedido(request)
         form = EventoForm(request.POST, request.FILES)
-        if form.is_valid():
+        if excedido:
+            # O campo só existe no form se o arquivo grande veio nele
+            form.add_error(excedido if excedido in form.fields else None, "Arquivo muito grande.")
+            status = 413
+        elif form.is_valid():
             evento = form.save(commit=False)
             evento.clube = clube
             evento.save()
@@ -1130,7 +1360,7 @@ def criar_evento(request, clube_id):
     else:
         form = EventoForm()
 
-    return render(request, 'chat/criar_evento.html', {'form': form, 'clube': clube})
+    return render(request, 'chat/criar_evento.html', {'form': form, 'clube': clube}, status=status)
 
 
 
@@ -1140,8 +1370,7 @@ def bloquear_usuario(request, id):
     usuario_a_bloquear = get_object_or_404(Usuario, id=id)
 
     # Adiciona o usuário a bloquear à lista de bloqueados do usuário logado
-    usuario_logado.bloqueados.add(usuario_a_bloquear)
-    usuario_logado.save()
+    usuario_logado.bloquear(usuario_a_bloquear)
 
     return redirect('chat:perfil_usuario', usuario_id=usuario_a_bloquear.id)
 
@@ -1150,8 +1379,7 @@ def desbloquear_usuario(request, id):
     usuario_logado = get_usuario_logado(request)
     usuario_a_desbloquear = get_object_or_404(Usuario, id=id)
 
-    usuario_logado.bloqueados.remove(usuario_a_desbloquear)
-    usuario_logado.save()
+    usuario_logado.desbloquear(usuario_a_desbloquear)
 
     return redirect('chat:perfil_usuario', usuario_id=usuario_a_desbloquear.id)
 
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'chat.middleware.UsuarioMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -67,15 +68,47 @@ TEMPLATES = [
 # ------------------------------
 ASGI_APPLICATION = "coffee.asgi.application"
 
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [os.environ.get("REDIS_URL", "redis://localhost:6379")],
+            "hosts": [REDIS_URL],
         },
     },
 }
 
+# ------------------------------
+# Cache
+# ------------------------------
+# Compartilhado entre workers; em dev dá para usar
+# CACHE_BACKEND=django.core.cache.backends.locmem.LocMemCache
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.redis.RedisCache"),
+        "LOCATION": REDIS_URL,
+    },
+}
+
+# ------------------------------
+# Matchmaking (fila do chat aleatório)
+# ------------------------------
+# Use "chat.matching.InMemoryMatchmaker" só com um único worker.
+# Com SCHEDULER ligado (exige o RedisMatchmaker), quem pareia é só o `manage.py matchmaker`. Para ligar:
+# MATCHMAKING_SCHEDULER=True em todos os processos e, no Procfile, um
+# `worker: python manage.py matchmaker`.
+MATCHMAKING = {
+    "BACKEND": os.environ.get("MATCHMAKING_BACKEND", "chat.matching.RedisMatchmaker"),
+    "CONFIG": {
+        "url": REDIS_URL,
+    },
+    "SCHEDULER": {
+        "ENABLED": os.environ.get("MATCHMAKING_SCHEDULER", "False") == "True",
+        "TICK_MS": int(os.environ.get("MATCHMAKING_TICK_MS", 500)),
+    },
+}
+
 # ------------------------------
 # Banco de dados
 # ------------------------------
@@ -114,8 +147,26 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # ------------------------------
 # Limites upload
 # ------------------------------
-DATA_UPLOAD_MAX_MEMORY_SIZE = 2147483648  # 2GB
-FILE_UPLOAD_MAX_MEMORY_SIZE = 2147483648  # 2GB
+# Corpo não-arquivo (JSON, campos de formulário); a foto de perfil ainda vem como data URL
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Acima disso o arquivo vai para um temporário em disco em vez da memória
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB
+
+FILE_UPLOAD_HANDLERS = [
+    "chat.uploads.LimiteUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
+# Tamanho máximo por tipo de arquivo: os padrões ficam em chat/uploads.py
+# (DEFAULT_UPLOAD_LIMITS); para mudar um, defina só ele, por exemplo
+# UPLOAD_LIMITS = {"video/": 200 * 1024 * 1024}
+
+# Miniaturas/WebP/áudio normalizado gerados em segundo plano (ver chat/midia_pipeline.py)
+MEDIA_PIPELINE = {
+    "ENABLED": os.environ.get("MEDIA_PIPELINE", "True") == "True",
+    "WORKERS": int(os.environ.get("MEDIA_PIPELINE_WORKERS", 2)),
+}
 
 # ------------------------------
 # Email